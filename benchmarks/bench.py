@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+# Бенчмарки depviz и эмулятора VFS на синтетических данных.
+# Запуск из корня репозитория:
+#   python benchmarks/bench.py                         # 10k пакетов, небольшие VFS
+#   python benchmarks/bench.py --packages 10000 100000 --save-baseline benchmarks/baseline.json
+#   python benchmarks/bench.py --baseline benchmarks/baseline.json   # код 1 при регрессии
+#   python benchmarks/bench.py --only startup --import-budget-ms 80  # время старта main.py
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from practice_2_var_15.depviz import depviz  # noqa: E402
+from practice_1_var_14 import commands as cmdmod  # noqa: E402
+from practice_1_var_14.runner import ScriptRunner  # noqa: E402
+
+
+# Генераторы синтетических данных
+def generate_apkindex(n_packages, fanout=4, depth=12, cycle_density=0.01, seed=0):
+    # Пакеты разбиты на depth слоёв; зависимости ведут в более глубокие слои,
+    # с вероятностью cycle_density добавляется обратное ребро (цикл).
+    # Половина зависимостей записывается через so:, как в настоящих индексах.
+    rnd = random.Random(seed)
+    layer_size = max(1, n_packages // depth)
+    lines = []
+    for i in range(n_packages):
+        layer = i // layer_size
+        deps = []
+        first_deeper = (layer + 1) * layer_size
+        if first_deeper < n_packages:
+            for _ in range(rnd.randint(0, fanout)):
+                j = rnd.randrange(first_deeper, n_packages)
+                deps.append(f"so:libpkg{j}.so.1" if rnd.random() < 0.5 else f"pkg{j}>=1.0")
+        if layer > 0 and rnd.random() < cycle_density:
+            deps.append(f"pkg{rnd.randrange(0, layer * layer_size)}")
+        lines.append(f"P:pkg{i}")
+        lines.append("V:1.0-r0")
+        lines.append(f"S:{rnd.randint(1000, 100000)}")
+        lines.append(f"I:{rnd.randint(1000, 500000)}")
+        if deps:
+            lines.append("D:" + " ".join(deps))
+        lines.append(f"p:so:libpkg{i}.so.1=1 cmd:pkg{i}=1.0-r0")
+        lines.append("")
+    return "\n".join(lines).encode("utf-8")
+
+
+def write_apkindex_archive(path, index_bytes):
+    with tarfile.open(path, "w:gz") as tar:
+        info = tarfile.TarInfo("APKINDEX")
+        info.size = len(index_bytes)
+        tar.addfile(info, io.BytesIO(index_bytes))
+
+
+VFS_SHAPES = {
+    # имя: (число директорий на уровне, глубина, файлов в директории, что растёт с --vfs-scale)
+    "wide": (1, 1, 5000, "files"),
+    "deep": (1, 200, 2, "depth"),
+    "many_small": (100, 1, 100, "width"),
+}
+# Запас до PATH_MAX для имени файла и префикса временного каталога
+PATH_MAX = 4096 - 256
+
+
+def scale_vfs_shape(shape, scale, base):
+    # --vfs-scale увеличивает то измерение, которое определяет форму дерева
+    width, depth, files_per_dir, scaled = VFS_SHAPES[shape]
+    if scaled == "files":
+        files_per_dir *= scale
+    elif scaled == "width":
+        width *= scale
+    else:
+        depth *= scale
+        # путь вида d0/l1/l2/... не может быть длиннее PATH_MAX
+        length = len(base) + len("/d0")
+        for level in range(1, depth):
+            length += len(f"/l{level}")
+            if length > PATH_MAX:
+                print(f"[{shape}] глубина ограничена {level} (PATH_MAX) вместо {depth}")
+                depth = level
+                break
+    return width, depth, files_per_dir
+
+
+def generate_vfs_tree(base, width, depth, files_per_dir):
+    # Возвращает список путей к файлам внутри VFS (для поиска и скриптов)
+    files = []
+    for w in range(width):
+        rel = f"d{w}"
+        for level in range(depth):
+            if level:
+                rel += f"/l{level}"
+            os.makedirs(os.path.join(base, rel), exist_ok=True)
+            for f in range(files_per_dir):
+                name = f"{rel}/f{f}.txt"
+                with open(os.path.join(base, name), "w", encoding="utf-8") as fh:
+                    fh.write(f"file {name}\n")
+                files.append("/" + name)
+    return files
+
+
+def generate_script(files, n_lines, seed=0):
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(n_lines // 3):
+        path = rnd.choice(files)
+        parent = path.rsplit("/", 1)[0] or "/"
+        out.append(f"cd {parent}")
+        out.append("ls .")
+        out.append(f"cat {path}")
+    return out
+
+
+# Замеры
+def timeit(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def walk_vfs(node):
+    count = 0
+    stack = [node]
+    while stack:
+        n = stack.pop()
+        count += 1
+        if n.type == "dir":
+            stack.extend(cmdmod.dir_children(n).values())
+    return count
+
+
+def bench_depviz(n_packages, workdir, repeat, results):
+    archive = os.path.join(workdir, f"APKINDEX-{n_packages}.tar.gz")
+    write_apkindex_archive(archive, generate_apkindex(n_packages))
+    tag = f"[{n_packages}]"
+
+    deps_map = depviz.parse_apk_dependencies(depviz.read_apkindex(archive))
+    results["depviz.parse" + tag] = timeit(
+        lambda: depviz.parse_apk_dependencies(depviz.read_apkindex(archive)), repeat)
+
+    cache_dir = os.path.join(workdir, "cache")
+    with contextlib.redirect_stdout(io.StringIO()):
+        depviz.load_apk_dependencies([archive], cache_dir)
+        results["depviz.cache_load" + tag] = timeit(lambda: depviz.load_apk_dependencies([archive], cache_dir), repeat)
+
+    roots = [f"pkg{i}" for i in range(0, n_packages // 12, max(1, n_packages // 120))]
+    graphs = {}
+
+    def bfs():
+        for root in roots:
+            graphs[root] = depviz.build_dependency_graph(root, deps_map, 50)
+    results["depviz.build_dependency_graph" + tag] = timeit(bfs, repeat)
+
+    def load_order():
+        for root in roots:
+            depviz.get_load_order(graphs[root], root)
+    results["depviz.get_load_order" + tag] = timeit(load_order, repeat)
+
+    results["depviz.report" + tag] = timeit(lambda: depviz.IndexGraph(deps_map).report(), repeat)
+
+    candidates = [depviz.Candidate(r, 0) for r in depviz.read_apkindex(archive) if r.get("name")]
+
+    def resolve_versions():
+        # новый резолвер на каждый повтор: замыкания переиспользуются только между корнями
+        resolver = depviz.VersionResolver(candidates)
+        for root in roots:
+            resolver.resolve([root])
+        resolver.resolve(roots)
+    results["depviz.resolve_versions" + tag] = timeit(resolve_versions, repeat)
+
+
+def bench_vfs(shape, scale, script_lines, workdir, repeat, results):
+    base = os.path.join(workdir, "vfs_" + shape)
+    files = generate_vfs_tree(base, *scale_vfs_shape(shape, scale, base))
+    tag = f"[{shape}]"
+
+    results["vfs.build_vfs_from_disk+walk" + tag] = timeit(
+        lambda: walk_vfs(cmdmod.build_vfs_from_disk(base)), repeat)
+
+    root = cmdmod.build_vfs_from_disk(base)
+    walk_vfs(root)
+
+    def lookups():
+        for path in files:
+            cmdmod.get_node_by_path(root, path)
+    lookups()
+    results["vfs.get_node_by_path" + tag] = timeit(lookups, repeat)
+
+    script = generate_script(files, script_lines)
+
+    def run_script():
+        runner = ScriptRunner(io.StringIO())
+        runner.vfs = root
+        runner.run_lines(script)
+    results["vfs.script" + tag] = timeit(run_script, repeat)
+
+    names = [path.rsplit("/", 1)[1] for path in files[::max(1, len(files) // 100)]]
+
+    def search():
+        runner = ScriptRunner(io.StringIO())
+        runner.vfs = root
+        for name in names:
+            cmdmod.execute_command("find", ["/", "-name", name], runner)
+        cmdmod.execute_command("grep", ["-l", "file f1", "/"], runner)
+
+    start = time.perf_counter()
+    search()
+    results["vfs.find+grep.cold" + tag] = time.perf_counter() - start
+    results["vfs.find+grep" + tag] = timeit(search, repeat)
+
+
+# Время старта лаунчера main.py: python -X importtime в отдельном процессе.
+# Модули, которые подкоманда не должна загружать при обычном запуске
+STARTUP_FORBIDDEN = ("tkinter", "asyncio", "urllib.request", "tarfile", "graphviz", "matplotlib")
+
+
+def startup_scenarios(workdir):
+    report = os.path.join(workdir, "startup_report.json")
+    repo = os.path.join(ROOT, "practice_2_var_15", "depviz", "test_repos", "repo_complex.txt")
+    return {
+        "emulator": (["emulator", "--headless", "--vfs_path", workdir], "pwd\nls /\n"),
+        "depviz": (["depviz", "--mode", "test", "--repo", repo, "--report", report], ""),
+    }
+
+
+def measure_startup(argv, stdin):
+    # -> (суммарное время импортов, время процесса, загруженные модули)
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", os.path.join(ROOT, "main.py")] + argv,
+                          input=stdin, capture_output=True, text=True, cwd=ROOT)
+    wall = time.perf_counter() - start
+    if proc.returncode:
+        raise RuntimeError(f"main.py {' '.join(argv)}: код {proc.returncode}\n{proc.stderr[-2000:]}")
+    total_us = 0
+    modules = set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # строка заголовка
+        modules.add(name.strip())
+        if not name.startswith("  "):
+            total_us += int(cumulative)  # только модули верхнего уровня: вложенные уже в них
+    return total_us / 1e6, wall, modules
+
+
+def bench_startup(workdir, repeat, budget_ms, results):
+    # Возвращает список нарушений: запрещённые модули и превышение бюджета
+    problems = []
+    for name, (argv, stdin) in startup_scenarios(workdir).items():
+        runs = [measure_startup(argv, stdin) for _ in range(repeat)]
+        imports = min(r[0] for r in runs)
+        results[f"startup.{name}.imports"] = imports
+        results[f"startup.{name}.process"] = min(r[1] for r in runs)
+        loaded = sorted(m for m in STARTUP_FORBIDDEN if m in runs[0][2])
+        if loaded:
+            problems.append(f"main.py {name}: загружены {', '.join(loaded)}")
+        if budget_ms and imports * 1000 > budget_ms:
+            problems.append(f"main.py {name}: импорты {imports * 1000:.1f} ms > бюджета {budget_ms:.1f} ms")
+    return problems
+
+
+# Сравнение с базовой линией
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, elapsed in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            continue
+        ratio = elapsed / base if base else float("inf")
+        if ratio > threshold:
+            regressions.append((name, base, elapsed, ratio))
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Бенчмарки depviz и эмулятора VFS")
+    parser.add_argument("--packages", type=int, nargs="+", default=[10000],
+                        help="Размеры синтетических индексов (по умолчанию 10000)")
+    parser.add_argument("--vfs-scale", type=int, default=1, help="Множитель размера синтетических VFS: файлов в wide, глубины deep, директорий many_small")
+    parser.add_argument("--script-lines", type=int, default=3000, help="Длина синтетического скрипта эмулятора")
+    parser.add_argument("--repeat", type=int, default=3, help="Число повторов (берётся минимум)")
+    parser.add_argument("--only", choices=["depviz", "vfs", "startup"], help="Запустить только одну группу")
+    parser.add_argument("--json", help="Сохранить результаты в JSON")
+    parser.add_argument("--history", help="Дописать результаты строкой JSON в файл истории")
+    parser.add_argument("--baseline", help="Сравнить с базовой линией (JSON)")
+    parser.add_argument("--save-baseline", help="Сохранить результаты как базовую линию")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="Допустимое замедление относительно базовой линии (по умолчанию 1.25)")
+    parser.add_argument("--import-budget-ms", type=float, default=100.0,
+                        help="Бюджет суммарного времени импортов при старте main.py, мс (0 - без проверки)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = {}
+    startup_problems = []
+    workdir = tempfile.mkdtemp(prefix="bench_")
+    try:
+        if args.only in (None, "depviz"):
+            for n in args.packages:
+                bench_depviz(n, workdir, args.repeat, results)
+        if args.only in (None, "vfs"):
+            for shape in VFS_SHAPES:
+                bench_vfs(shape, args.vfs_scale, args.script_lines, workdir, args.repeat, results)
+        if args.only in (None, "startup"):
+            startup_problems = bench_startup(workdir, args.repeat, args.import_budget_ms, results)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for name, elapsed in results.items():
+        print(f"{name:50s} {elapsed * 1000:10.2f} ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+    if args.history:
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}) + "\n")
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+        print(f"Базовая линия сохранена: {args.save_baseline}")
+    for problem in startup_problems:
+        print(f"СТАРТ {problem}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for name, base, elapsed, ratio in regressions:
+            print(f"РЕГРЕССИЯ {name}: {base * 1000:.2f} ms -> {elapsed * 1000:.2f} ms (x{ratio:.2f})")
+        if regressions:
+            sys.exit(1)
+        print("Регрессий нет")
+    if startup_problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,57 @@
 # Общий лаунчер для запуска программ из практических работ
+#
+#   python main.py emulator [параметры эмулятора]
+#   python main.py depviz [параметры depviz]
+#
+# Модуль подкоманды импортируется только после выбора: запуск depviz не
+# загружает эмулятор (и tkinter), запуск эмулятора - depviz. Поэтому здесь
+# нет argparse: разбор аргументов целиком остаётся за самой программой.
+import sys
+
+
+def run_emulator():
+    from practice_1_var_14.emulator import main
+    return main()
+
+
+def run_depviz():
+    from practice_2_var_15.depviz.depviz import main
+    return main()
+
+
+def run_multisession():
+    from practice_1_var_14.multisession import main
+    return main()
+
+
+COMMANDS = {
+    "emulator": (run_emulator, "эмулятор командной оболочки (практика 1)"),
+    "multisession": (run_multisession, "параллельный запуск сценариев эмулятора"),
+    "depviz": (run_depviz, "визуализатор зависимостей пакетов (практика 2)"),
+}
+
+
+def usage(out):
+    out.write("Использование: python main.py <команда> [параметры]\n\nКоманды:\n")
+    for name, (_, help_text) in COMMANDS.items():
+        out.write(f"  {name:<14}{help_text}\n")
+    out.write("\nПараметры команды: python main.py <команда> --help\n")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ("-h", "--help"):
+        usage(sys.stdout if argv else sys.stderr)
+        return 0 if argv else 2
+    name = argv[0]
+    if name not in COMMANDS:
+        sys.stderr.write(f"Неизвестная команда: {name}\n")
+        usage(sys.stderr)
+        return 2
+    # программа читает sys.argv сама; в справке argparse - "main.py <команда>"
+    sys.argv = [f"main.py {name}"] + argv[1:]
+    return COMMANDS[name][0]()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,42 +1,227 @@
 import os
+import re
+import sys
+import threading
 import getpass
-import calendar
-from datetime import datetime
+import fnmatch
+from collections import OrderedDict
+from functools import lru_cache
+
+
+# Сколько стоит сама запись кэша (ключ, узел OrderedDict): пустые и нечитаемые
+# файлы тоже занимают память и должны вытесняться
+CACHE_ENTRY_OVERHEAD = 128
+
+
+def _cache_cost(value):
+    return CACHE_ENTRY_OVERHEAD + (len(value) if value else 0)
+
+
+# Кэш содержимого файлов: LRU, ограничен суммарным размером (в символах
+# плюс CACHE_ENTRY_OVERHEAD на запись)
+class ContentCache:
+    def __init__(self, max_size=64 * 1024 * 1024):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        # кэш общий для всех сессий (см. multisession.py); чтение файла - вне блокировки
+        self._lock = threading.Lock()
+
+    def get(self, key, loader):
+        with self._lock:
+            if key in self._data:
+                self.hits += 1
+                self._data.move_to_end(key)
+                return self._data[key]
+            self.misses += 1
+        value = loader(key)
+        cost = _cache_cost(value)
+        if cost > self.max_size:
+            # слишком большой файл не кэшируем, чтобы не вытеснять всё остальное
+            return value
+        with self._lock:
+            if key in self._data:
+                return self._data[key]
+            self._data[key] = value
+            self.size += cost
+            while self.size > self.max_size:
+                _, old = self._data.popitem(last=False)
+                self.size -= _cache_cost(old)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+
+content_cache = ContentCache()
+
+
+# Счётчики для профилирования (--profile). Увеличиваются только на медленных
+# путях (промах кэша путей, чтение директории или файла), поэтому без
+# профилирования почти ничего не стоят. bytes_read считается в символах.
+class VFSStats:
+    __slots__ = ("nodes_visited", "dirs_scanned", "bytes_read")
+
+    def __init__(self):
+        self.nodes_visited = 0
+        self.dirs_scanned = 0
+        self.bytes_read = 0
+
+
+vfs_stats = VFSStats()
+
+
+def set_content_cache_limit(max_size):
+    content_cache.max_size = max_size
+    content_cache.clear()
+
+
+def _read_disk_file(fpath):
+    try:
+        with open(fpath, "r", encoding="utf-8") as fh:
+            text = fh.read()
+    except Exception:
+        return None
+    vfs_stats.bytes_read += len(text)
+    return text
+
+
+# Узел VFS. __slots__ вместо словаря: нет повторяющихся ключей и накладных
+# расходов dict на каждый узел; type и owner интернируются.
+class VFSNode:
+    __slots__ = ("type", "owner", "children", "content", "source")
+
+    def __init__(self, node_type, owner="root", children=None, content=None, source=None):
+        self.type = sys.intern(node_type)
+        self.owner = sys.intern(owner)
+        self.children = children
+        self.content = content
+        self.source = source
+
+    def clone(self, owner=None):
+        # Поверхностная копия; словарь children разделяется с оригиналом,
+        # поэтому менять его можно только через vfs_set
+        children = dir_children(self) if self.type == "dir" else None
+        return VFSNode(self.type, owner or self.owner, children, self.content, self.source)
+
+    def __repr__(self):
+        return f"VFSNode({self.type!r}, owner={self.owner!r})"
+
+
+def _dir_node(source=None, owner="root"):
+    # children = None -> содержимое директории ещё не прочитано с диска
+    return VFSNode("dir", owner, children=None if source else {}, source=source)
+
+
+def _file_node(source=None, content="", owner="root"):
+    # content = None при source != None -> содержимое читается при первом обращении
+    return VFSNode("file", owner, content=None if source else content, source=source)
+
+
+def empty_vfs():
+    return _dir_node()
 
 
 def build_vfs_from_disk(path_on_disk):
-    root = {"type": "dir", "children": {}, "owner": "root"}
-    base = os.path.abspath(path_on_disk)
+    # Ленивая загрузка: директории читаются при первом доступе, файлы - при cat
+    return _dir_node(os.path.abspath(path_on_disk))
 
-    for r, dirs, files in os.walk(base):
-        rel = os.path.relpath(r, base)
 
-        if rel == ".":
-            node = root
-        else:
-            parts = rel.replace("\\", "/").split("/")
-            node = root
-            for p in parts:
-                if p not in node["children"]:
-                    node = node["children"].setdefault(p, {"type": "dir", "children": {}, "owner": "root"})
+def _scan_disk_dir(path):
+    vfs_stats.dirs_scanned += 1
+    children = {}
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir and entry.is_symlink():
+                    # как и os.walk: ссылку на директорию показываем, но не обходим
+                    children[entry.name] = _dir_node()
+                elif is_dir:
+                    children[entry.name] = _dir_node(entry.path)
                 else:
-                    node = node["children"][p]
+                    children[entry.name] = _file_node(entry.path)
+    except OSError:
+        pass
+    return children
+
+
+# source узла - путь на диске (str) либо объект-источник с методами
+# list_children() и read() (например, запись образа VFS, см. vfs_image.py)
+def dir_children(node):
+    children = node.children
+    if children is None:
+        if isinstance(node.source, str):
+            children = _scan_disk_dir(node.source)
+        else:
+            children = node.source.list_children()
+        node.children = children
+    return children
 
-        for d in dirs:
-            node["children"].setdefault(d, {"type": "dir", "children": {}, "owner": "root"})
 
-        for f in files:
-            fpath = os.path.join(r, f)
-            try:
-                with open(fpath, "r", encoding="utf-8") as fh:
-                    content = fh.read()
-            except Exception:
-                content = None
-            node["children"][f] = {"type": "file", "content": content, "owner": "root"}
+def _read_source(source):
+    text = source.read()
+    vfs_stats.bytes_read += len(text) if text else 0
+    return text
+
+
+def file_content(node):
+    if node.content is None and node.source:
+        if isinstance(node.source, str):
+            return content_cache.get(node.source, _read_disk_file)
+        return content_cache.get(node.source, _read_source)
+    return node.content
+
 
-    return root
+# Потоковое чтение для конвейеров (cat big.log | grep x | head): большие
+# файлы с диска читаются кусками мимо кэша, источники из образа - кусками
+# через read_chunks(), остальное - срезами уже прочитанного текста.
+CHUNK_SIZE = 64 * 1024
+STREAM_MIN_SIZE = 1024 * 1024
 
 
+def _read_disk_chunks(fpath, chunk_size):
+    try:
+        with open(fpath, "r", encoding="utf-8") as fh:
+            while True:
+                chunk = fh.read(chunk_size)
+                if not chunk:
+                    return
+                vfs_stats.bytes_read += len(chunk)
+                yield chunk
+    except (OSError, UnicodeDecodeError):
+        return
+
+
+def iter_file_chunks(node, chunk_size=CHUNK_SIZE):
+    source = node.source
+    if node.content is None and source:
+        if isinstance(source, str):
+            try:
+                big = os.path.getsize(source) > STREAM_MIN_SIZE
+            except OSError:
+                big = False
+            if big:
+                yield from _read_disk_chunks(source, chunk_size)
+                return
+        elif hasattr(source, "read_chunks"):
+            for chunk in source.read_chunks(chunk_size):
+                vfs_stats.bytes_read += len(chunk)
+                yield chunk
+            return
+    text = file_content(node) or ""
+    for i in range(0, len(text), chunk_size):
+        yield text[i:i + chunk_size]
+
+
+@lru_cache(maxsize=4096)
 def normalize_vfs_path(current_dir, path):
     if path is None or path == "":
         return current_dir or "/"
@@ -69,23 +254,306 @@ def path_to_parts(path):
     return [p for p in path.lstrip("/").split("/") if p]
 
 
-def get_node_by_path(vfs_root, path):
+# Индекс "разрешённый путь -> узел" (LRU). Ключ включает корень VFS, а
+# дерево не меняется на месте (см. vfs_set), поэтому кэшировать можно и
+# промахи (None): после изменения у дерева новый корень и новые ключи.
+class PathCache:
+    def __init__(self, max_entries=65536):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, vfs_root, path, resolver):
+        key = (vfs_root, path)
+        with self._lock:
+            node = self._data.get(key, self)
+            if node is not self:
+                self.hits += 1
+                self._data.move_to_end(key)
+                return node
+            self.misses += 1
+        node = resolver(vfs_root, path)
+        with self._lock:
+            self._data[key] = node
+            if len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+        return node
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+path_cache = PathCache()
+
+
+def profile_counters():
+    # текущие значения счётчиков для Profiler (см. profiler.py)
+    return {
+        "path_cache_hits": path_cache.hits,
+        "path_cache_misses": path_cache.misses,
+        "content_cache_hits": content_cache.hits,
+        "content_cache_misses": content_cache.misses,
+        "nodes_visited": vfs_stats.nodes_visited,
+        "dirs_scanned": vfs_stats.dirs_scanned,
+        "bytes_read": vfs_stats.bytes_read,
+    }
+
+
+def _resolve_path(vfs_root, path):
     parts = path_to_parts(path)
+    vfs_stats.nodes_visited += len(parts)
     node = vfs_root
     for p in parts:
-        if node["type"] != "dir":
+        if node.type != "dir":
             return None
-        if p not in node["children"]:
+        node = dir_children(node).get(p)
+        if node is None:
             return None
-        node = node["children"][p]
     return node
 
 
-def cmd_pwd(gui):
-    return gui.current_dir
+def get_node_by_path(vfs_root, path):
+    return path_cache.lookup(vfs_root, path, _resolve_path)
+
+
+# Изменение дерева копированием пути (copy-on-write): копируются только узлы
+# от корня до изменяемого, остальное дерево разделяется с прежней версией.
+# Старый корень остаётся целым снимком, поэтому снимок VFS - это просто
+# ссылка на корень, а откат - возврат этой ссылки.
+def vfs_set(vfs_root, parts, new_node):
+    # new_node = None удаляет узел; возвращает новый корень
+    if not parts:
+        return new_node
+    new_root = vfs_root.clone()
+    node = new_root
+    for p in parts[:-1]:
+        children = dict(node.children)
+        node.children = children
+        node = children[p] = children[p].clone()
+    children = dict(node.children)
+    node.children = children
+    if new_node is None:
+        old_node = children.pop(parts[-1], None)
+    else:
+        old_node = children.get(parts[-1])
+        children[parts[-1]] = new_node
+    vfs_index.record(vfs_root, new_root, parts, old_node, new_node)
+    return new_root
+
+
+# Индексы для find/grep. Для корня VFS строится базовый индекс (имя -> пути,
+# путь -> узел, лениво - триграммы содержимого). Запись (vfs_set) не
+# перестраивает его и не ждёт, пока он появится: для нового корня
+# запоминается ссылка "родительский корень + изменение". При поиске по корню
+# без индекса цепочка ссылок проходится до корня с индексом (или до самого
+# старого известного предка), базовый индекс строится один раз для предка,
+# а изменения накладываются дельтой "путь -> новый узел (None - удалён)".
+# Так сессии над общим VFS (multisession.py), сделавшие по паре записей,
+# делят один базовый индекс. Дельта ограничена DELTA_LIMIT, после чего
+# индекс строится заново для текущего корня.
+DELTA_LIMIT = 1024
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class _BaseIndex:
+    def __init__(self, vfs_root):
+        self.names = {}
+        self.nodes = {}
+        stack = [("/", vfs_root)]
+        while stack:
+            path, node = stack.pop()
+            self.nodes[path] = node
+            if path != "/":
+                self.names.setdefault(path.rsplit("/", 1)[1], []).append(path)
+            if node.type == "dir":
+                prefix = path if path != "/" else ""
+                for name, child in dir_children(node).items():
+                    stack.append((prefix + "/" + name, child))
+        self.files = None
+        self.trigrams = None
+        self._lock = threading.Lock()
+
+    def content_index(self):
+        # Строится при первом grep: читает содержимое всех файлов
+        with self._lock:
+            if self.trigrams is None:
+                files = []
+                trigrams = {}
+                for path, node in self.nodes.items():
+                    if node.type != "file":
+                        continue
+                    file_id = len(files)
+                    files.append(path)
+                    for t in _trigrams((file_content(node) or "").lower()):
+                        posting = trigrams.get(t)
+                        if posting is None:
+                            trigrams[t] = {file_id}
+                        else:
+                            posting.add(file_id)
+                self.files = files
+                self.trigrams = trigrams
+        return self.files, self.trigrams
+
+
+class VFSIndex:
+    def __init__(self, base, delta=None):
+        self.base = base
+        self.delta = delta or {}
+
+    def node(self, path):
+        if path in self.delta:
+            return self.delta[path]
+        return self.base.nodes.get(path)
+
+    def paths_by_name(self, name):
+        delta = self.delta
+        for path in self.base.names.get(name, ()):
+            if path not in delta:
+                yield path
+        for path, node in delta.items():
+            if node is not None and path.rsplit("/", 1)[1] == name:
+                yield path
+
+    def names(self):
+        names = set(self.base.names)
+        names.update(path.rsplit("/", 1)[1] for path in self.delta)
+        return names
+
+    def paths(self):
+        delta = self.delta
+        for path in self.base.nodes:
+            if path not in delta:
+                yield path
+        for path, node in delta.items():
+            if node is not None:
+                yield path
+
+    def grep_candidates(self, needle):
+        # Файлы, которые могут содержать needle (в нижнем регистре);
+        # для needle короче 3 символов - все файлы
+        delta = self.delta
+        files, trigrams = self.base.content_index()
+        if len(needle) < 3:
+            ids = range(len(files))
+        else:
+            postings = []
+            for t in _trigrams(needle):
+                posting = trigrams.get(t)
+                if not posting:
+                    ids = ()
+                    break
+                postings.append(posting)
+            else:
+                postings.sort(key=len)
+                ids = set(postings[0]).intersection(*postings[1:])
+        for file_id in ids:
+            path = files[file_id]
+            if path not in delta:
+                yield path
+        for path, node in delta.items():
+            if node is not None and node.type == "file":
+                yield path
+
+
+class IndexCache:
+    # корень VFS -> VFSIndex (LRU), как и PathCache; плюс ссылки
+    # "корень -> (родительский корень, изменение)" от vfs_set
+    def __init__(self, max_entries=256, max_links=4096):
+        self.max_entries = max_entries
+        self.max_links = max_links
+        self._data = OrderedDict()
+        self._links = OrderedDict()
+        self._lock = threading.Lock()
+        # базовый индекс - полный обход VFS: строится одним потоком,
+        # остальные ждут и берут готовый
+        self._build_lock = threading.Lock()
+
+    def _put(self, vfs_root, index):
+        with self._lock:
+            self._data[vfs_root] = index
+            self._data.move_to_end(vfs_root)
+            if len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def _build(self, vfs_root):
+        with self._build_lock:
+            with self._lock:
+                index = self._data.get(vfs_root)
+            if index is None:
+                index = VFSIndex(_BaseIndex(vfs_root))
+                self._put(vfs_root, index)
+        return index
+
+    def get(self, vfs_root):
+        changes = []
+        with self._lock:
+            root = vfs_root
+            index = self._data.get(root)
+            while index is None and len(changes) < DELTA_LIMIT:
+                link = self._links.get(root)
+                if link is None or link[1] is None:
+                    break
+                root, change = link
+                changes.append(change)
+                index = self._data.get(root)
+            if index is not None:
+                self._data.move_to_end(root)
+            elif len(changes) >= DELTA_LIMIT:
+                # слишком длинная цепочка: дешевле новый индекс текущего корня
+                root, changes = vfs_root, []
+        if index is None:
+            index = self._build(root)
+        if root is vfs_root:
+            return index
+        delta = dict(index.delta)
+        for change in reversed(changes):
+            if change:
+                delta[change[0]] = change[1]
+        if len(delta) > DELTA_LIMIT:
+            return self._build(vfs_root)
+        index = VFSIndex(index.base, delta)
+        self._put(vfs_root, index)
+        return index
+
+    def record(self, old_root, new_root, parts, old_node, new_node):
+        # Изменение, которое переводит индекс old_root в индекс new_root:
+        # () - ничего не изменилось, None - поддерево заменено целиком
+        # (дельтой не выразить, нужен новый базовый индекс)
+        if old_node is None and new_node is None:
+            change = ()
+        elif old_node is not None and old_node.type == "dir" and (
+                new_node is None or new_node.type != "dir" or new_node.children is not old_node.children):
+            change = None
+        elif (old_node is None or old_node.type != "dir") and new_node is not None and \
+                new_node.type == "dir" and (new_node.source or new_node.children):
+            change = None
+        else:
+            change = ("/" + "/".join(parts), new_node)
+        with self._lock:
+            self._links[new_root] = (old_root, change)
+            if len(self._links) > self.max_links:
+                self._links.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._links.clear()
+
+
+vfs_index = IndexCache()
+
 
+def cmd_pwd(session, args=None):
+    return session.current_dir
 
-def cmd_ls(gui, args):
+
+def cmd_ls(session, args):
     # support: ls [-a] [path]
     show_hidden = False
     path_arg = None
@@ -96,40 +564,40 @@ def cmd_ls(gui, args):
             path_arg = a
     if not path_arg:
         path_arg = ".."
-    resolved = normalize_vfs_path(gui.current_dir, path_arg)
-    node = get_node_by_path(gui.vfs, resolved)
+    resolved = normalize_vfs_path(session.current_dir, path_arg)
+    node = get_node_by_path(session.vfs, resolved)
     if node is None:
         return f"ls: невозможно получить доступ к '{path_arg}': Нет такого файла или директории"
-    if node["type"] == "file":
+    if node.type == "file":
         return path_arg
     items = []
-    for name, n in node["children"].items():
+    for name, n in dir_children(node).items():
         if not show_hidden and name.startswith("."):
             continue
-        items.append(name + ("/" if n["type"] == "dir" else ""))
+        items.append(name + ("/" if n.type == "dir" else ""))
     return "  ".join(sorted(items)) if items else ""
 
 
-def cmd_cd(gui, args):
+def cmd_cd(session, args):
     target = args[0] if args else ""
     if not target:
         home = "/home/" + getpass.getuser()
-        if get_node_by_path(gui.vfs, home):
+        if get_node_by_path(session.vfs, home):
             newp = home
         else:
             newp = "/"
     else:
-        newp = normalize_vfs_path(gui.current_dir, target)
-    node = get_node_by_path(gui.vfs, newp)
+        newp = normalize_vfs_path(session.current_dir, target)
+    node = get_node_by_path(session.vfs, newp)
     if node is None:
         return f"cd: {target}: Нет такого файла или директории"
-    if node["type"] != "dir":
+    if node.type != "dir":
         return f"cd: {target}: Не директория"
-    gui.current_dir = newp
-    return f"Текущая директория изменена на {gui.current_dir}"
+    session.current_dir = newp
+    return f"Текущая директория изменена на {session.current_dir}"
 
 
-def cmd_echo(gui, args):
+def cmd_echo(session, args):
     if not args:
         return ""
     out = []
@@ -141,7 +609,10 @@ def cmd_echo(gui, args):
     return " ".join(out)
 
 
-def cmd_cal(gui, args):
+def cmd_cal(session, args):
+    # calendar и datetime нужны только здесь: не загружаем их при каждом запуске
+    import calendar
+    from datetime import datetime
     try:
         if len(args) == 2:
             m = int(args[0]); y = int(args[1])
@@ -154,55 +625,150 @@ def cmd_cal(gui, args):
         return f"cal: неверные аргументы: {e}"
 
 
-def cmd_clear(gui, args):
+def cmd_clear(session, args):
     return ""
 
 
-def cmd_cat(gui, args):
+def cmd_cat(session, args):
     if not args:
         return "cat: требуется имя файла"
-    path = normalize_vfs_path(gui.current_dir, args[0])
-    node = get_node_by_path(gui.vfs, path)
+    path = normalize_vfs_path(session.current_dir, args[0])
+    node = get_node_by_path(session.vfs, path)
     if node is None:
         return f"cat: {args[0]}: Нет такого файла"
-    if node["type"] != "file":
+    if node.type != "file":
         return f"cat: {args[0]}: Это не файл"
-    return node.get("content") or ""
+    return file_content(node) or ""
 
 
-def cmd_touch(gui, args):
+def cmd_touch(session, args):
     if not args:
         return "touch: требуется имя файла"
     name = args[0]
-    full = normalize_vfs_path(gui.current_dir, name)
+    full = normalize_vfs_path(session.current_dir, name)
     if full == "/":
         return "touch: неверное имя файла"
     parts = path_to_parts(full)
     parent_path = "/" + "/".join(parts[:-1]) if parts[:-1] else "/"
-    parent = get_node_by_path(gui.vfs, parent_path)
-    if parent is None or parent["type"] != "dir":
+    parent = get_node_by_path(session.vfs, parent_path)
+    if parent is None or parent.type != "dir":
         return f"touch: {name}: Нет такой директории"
-    fname = parts[-1]
-    if fname in parent["children"]:
+    if parts[-1] in dir_children(parent):
         return ""
-    parent["children"][fname] = {"type": "file", "content": "", "owner": getpass.getuser()}
+    session.vfs = vfs_set(session.vfs, parts, _file_node(owner=getpass.getuser()))
     return f"Файл {full} создан (в памяти)"
 
 
-def cmd_chown(gui, args):
+def cmd_chown(session, args):
     if len(args) < 2:
         return "chown: требуется имя пользователя и имя файла/директории"
     new_owner = args[0]
     target = args[1]
-    resolved = normalize_vfs_path(gui.current_dir, target)
-    node = get_node_by_path(gui.vfs, resolved)
+    resolved = normalize_vfs_path(session.current_dir, target)
+    node = get_node_by_path(session.vfs, resolved)
     if node is None:
         return f"chown: {target}: Нет такого файла или директории"
-    node["owner"] = new_owner
+    session.vfs = vfs_set(session.vfs, path_to_parts(resolved), node.clone(owner=new_owner))
     return f"Владелец {resolved} изменён на {new_owner}"
 
 
-def cmd_exit(gui, args):
+def _under(path, start):
+    return start == "/" or path == start or path.startswith(start + "/")
+
+
+def cmd_find(session, args):
+    # find [путь] [-name шаблон] [-type f|d]
+    start_arg = "."
+    pattern = None
+    kind = None
+    i = 0
+    while i < len(args):
+        a = args[i]
+        if a in ("-name", "-type"):
+            if i + 1 >= len(args):
+                return f"find: отсутствует аргумент для '{a}'"
+            if a == "-name":
+                pattern = args[i + 1]
+            else:
+                kind = args[i + 1]
+                if kind not in ("f", "d"):
+                    return f"find: неизвестный тип '{kind}'"
+            i += 2
+            continue
+        if a.startswith("-"):
+            return f"find: неизвестный параметр '{a}'"
+        start_arg = a
+        i += 1
+    start = normalize_vfs_path(session.current_dir, start_arg)
+    node = get_node_by_path(session.vfs, start)
+    if node is None:
+        return f"find: '{start_arg}': Нет такого файла или директории"
+    index = vfs_index.get(session.vfs)
+    if pattern is None:
+        found = index.paths()
+    elif any(c in pattern for c in "*?["):
+        found = (path for name in index.names() if fnmatch.fnmatchcase(name, pattern)
+                 for path in index.paths_by_name(name))
+    else:
+        found = index.paths_by_name(pattern)
+    result = []
+    for path in found:
+        if not _under(path, start):
+            continue
+        if kind is not None and index.node(path).type != ("file" if kind == "f" else "dir"):
+            continue
+        result.append(path)
+    return "\n".join(sorted(result))
+
+
+def _parse_grep_args(args):
+    # -> (флаги, позиционные аргументы); флаги - множество из "i", "l", "n"
+    flags = set()
+    rest = []
+    for a in args:
+        if a.startswith("-") and len(a) > 1 and not rest:
+            for flag in a[1:]:
+                if flag not in "iln":
+                    raise ValueError(f"grep: неизвестный параметр '-{flag}'")
+                flags.add(flag)
+        else:
+            rest.append(a)
+    if not rest:
+        raise ValueError("grep: требуется строка для поиска")
+    return flags, rest
+
+
+def cmd_grep(session, args):
+    # grep [-i] [-l] [-n] строка [путь]; строка ищется как есть, без регулярных выражений
+    try:
+        flags, rest = _parse_grep_args(args)
+    except ValueError as e:
+        return str(e)
+    ignore_case, list_only, line_numbers = "i" in flags, "l" in flags, "n" in flags
+    needle = rest[0]
+    start_arg = rest[1] if len(rest) > 1 else "."
+    start = normalize_vfs_path(session.current_dir, start_arg)
+    node = get_node_by_path(session.vfs, start)
+    if node is None:
+        return f"grep: {start_arg}: Нет такого файла или директории"
+    if ignore_case:
+        needle = needle.lower()
+    index = vfs_index.get(session.vfs)
+    out = []
+    for path in sorted(index.grep_candidates(needle.lower())):
+        if not _under(path, start):
+            continue
+        content = file_content(index.node(path)) or ""
+        for n, line in enumerate(content.splitlines(), 1):
+            if needle in (line.lower() if ignore_case else line):
+                if list_only:
+                    out.append(path)
+                    break
+                out.append(f"{path}:{n}:{line}" if line_numbers else f"{path}:{line}")
+    return "\n".join(out)
+
+
+def cmd_exit(session, args):
     return None
 
 
@@ -217,13 +783,211 @@ COMMANDS = {
     "cat": cmd_cat,
     "touch": cmd_touch,
     "chown": cmd_chown,
+    "find": cmd_find,
+    "grep": cmd_grep,
     "exit": cmd_exit,
 }
 
 
-def execute_command(cmd, args, gui):
+def execute_command(cmd, args, session):
     fn = COMMANDS.get(cmd)
     if fn:
-        return fn(gui, args)
+        return fn(session, args)
     else:
         return f"Неизвестная команда: {cmd}"
+
+
+# Конвейеры и перенаправление: "cmd1 | cmd2 > файл", ">>" - дописать.
+# Команды из STREAM_COMMANDS - генераторы кусков текста, читающие stdin
+# (итератор кусков или None) лениво, поэтому "cat big | grep x | head"
+# не держит файл в памяти целиком и перестаёт читать после нужных строк.
+# Остальные команды выполняются сразу и дают один кусок - свой результат.
+_SPECIAL_CHARS = frozenset("'\"\\|>")
+_TOKEN_RE = re.compile(r"""(\s*)(?:(>>|[|>])|'([^']*)'|"((?:[^"\\]|\\.)*)"|\\(.)|([^\s'"\\|>]+)|(.))""", re.S)
+_DQUOTE_ESCAPE_RE = re.compile(r'\\([\\"])')
+
+
+def parse_command_line(line):
+    # -> (стадии [[команда, аргумент, ...], ...], перенаправление (">" | ">>", путь) или None).
+    # Кавычки и экранирование - как в shlex.split; строка без спецсимволов
+    # (самый частый случай) просто делится по пробелам.
+    if _SPECIAL_CHARS.isdisjoint(line):
+        return [line.split()], None
+    stages = [[]]
+    redirect = None
+    target_op = None
+    word = None
+    for m in _TOKEN_RE.finditer(line.strip()):
+        space, op, single, double, escaped, plain, bad = m.groups()
+        if word is not None and (space or op):
+            if target_op:
+                redirect = (target_op, word)
+                target_op = None
+            else:
+                stages[-1].append(word)
+            word = None
+        if op:
+            if target_op or redirect or not stages[-1]:
+                raise ValueError(f"синтаксическая ошибка рядом с '{op}'")
+            if op == "|":
+                stages.append([])
+            else:
+                target_op = op
+            continue
+        if bad is not None:
+            raise ValueError("нет закрывающей кавычки" if bad in "'\"" else "нет символа после '\\'")
+        if single is not None:
+            piece = single
+        elif double is not None:
+            piece = _DQUOTE_ESCAPE_RE.sub(r"\1", double)
+        elif escaped is not None:
+            piece = escaped
+        else:
+            piece = plain
+        word = piece if word is None else word + piece
+    if word is not None:
+        if target_op:
+            redirect = (target_op, word)
+            target_op = None
+        else:
+            stages[-1].append(word)
+    if target_op:
+        raise ValueError(f"не указан файл после '{target_op}'")
+    if not stages[-1]:
+        raise ValueError("синтаксическая ошибка: нет команды")
+    return stages, redirect
+
+
+def iter_lines(chunks):
+    # куски текста -> строки (с "\n", кроме, возможно, последней)
+    tail = ""
+    for chunk in chunks:
+        lines = (tail + chunk).split("\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line + "\n"
+    if tail:
+        yield tail
+
+
+def stream_cat(session, args, stdin):
+    if not args:
+        if stdin is None:
+            yield "cat: требуется имя файла\n"
+        else:
+            yield from stdin
+        return
+    for a in args:
+        node = get_node_by_path(session.vfs, normalize_vfs_path(session.current_dir, a))
+        if node is None:
+            yield f"cat: {a}: Нет такого файла\n"
+        elif node.type != "file":
+            yield f"cat: {a}: Это не файл\n"
+        else:
+            yield from iter_file_chunks(node)
+
+
+def stream_grep(session, args, stdin):
+    # с данными из конвейера и без пути фильтрует stdin, иначе - поиск по VFS
+    try:
+        flags, rest = _parse_grep_args(args)
+    except ValueError as e:
+        yield f"{e}\n"
+        return
+    if stdin is None or len(rest) > 1:
+        result = cmd_grep(session, args)
+        if result:
+            yield result + "\n"
+        return
+    needle = rest[0].lower() if "i" in flags else rest[0]
+    for n, line in enumerate(iter_lines(stdin), 1):
+        if needle in (line.lower() if "i" in flags else line):
+            if "l" in flags:
+                yield "(стандартный ввод)\n"
+                return
+            yield f"{n}:{line}" if "n" in flags else line
+
+
+def stream_head(session, args, stdin):
+    # head [-n N | -N] [файл]
+    count = 10
+    paths = []
+    i = 0
+    try:
+        while i < len(args):
+            a = args[i]
+            if a == "-n":
+                if i + 1 >= len(args):
+                    yield f"head: отсутствует аргумент для '{a}'\n"
+                    return
+                count = int(args[i + 1])
+                i += 1
+            elif a.startswith("-") and a[1:].isdigit():
+                count = int(a[1:])
+            else:
+                paths.append(a)
+            i += 1
+    except ValueError:
+        yield f"head: неверное число строк: {args[i + 1]}\n"
+        return
+    if paths:
+        stdin = stream_cat(session, paths[:1], None)
+    elif stdin is None:
+        yield "head: требуется имя файла\n"
+        return
+    if count <= 0:
+        return
+    for n, line in enumerate(iter_lines(stdin), 1):
+        yield line
+        if n >= count:
+            return
+
+
+STREAM_COMMANDS = {
+    "cat": stream_cat,
+    "grep": stream_grep,
+    "head": stream_head,
+}
+
+
+def _redirect_output(session, op, target, stream):
+    # Вывод конвейера становится содержимым узла-файла VFS (через vfs_set)
+    full = normalize_vfs_path(session.current_dir, target)
+    parts = path_to_parts(full)
+    node = get_node_by_path(session.vfs, full)
+    if not parts or (node is not None and node.type != "file"):
+        return [f"{target}: Это директория\n"]
+    parent = get_node_by_path(session.vfs, "/" + "/".join(parts[:-1]))
+    if parent is None or parent.type != "dir":
+        return [f"{target}: Нет такой директории\n"]
+    text = "".join(stream)
+    if op == ">>" and node is not None:
+        text = (file_content(node) or "") + text
+    owner = node.owner if node is not None else getpass.getuser()
+    session.vfs = vfs_set(session.vfs, parts, _file_node(content=text, owner=owner))
+    return []
+
+
+def execute_pipeline(stages, redirect, session):
+    # Итератор кусков вывода или None, если выполнена команда exit
+    profiler = session.profiler
+    stream = None
+    for argv in stages:
+        fn = STREAM_COMMANDS.get(argv[0])
+        if fn is not None:
+            stream = fn(session, argv[1:], stream)
+            if profiler is not None:
+                stream = profiler.stage(argv[0], stream)
+            continue
+        if profiler is None:
+            result = execute_command(argv[0], argv[1:], session)
+        else:
+            result = profiler.call_stage(argv[0], execute_command, argv[0], argv[1:], session)
+        if result is None:
+            if len(stages) == 1:
+                return None
+            result = ""
+        stream = [result if result.endswith("\n") else result + "\n"] if result else []
+    if redirect is not None:
+        return _redirect_output(session, redirect[0], redirect[1], stream)
+    return stream
@@ -6,6 +6,20 @@ def parse_args():
     # vfs = root
     parser.add_argument("--vfs_path", default="vfs",
                         help="Путь к директории-источнику VFS (по умолчанию vfs).")
+    parser.add_argument("--vfs_image", default=None,
+                        help="Образ VFS (python -m practice_1_var_14.vfs_image); если задан, --vfs_path не используется.")
     parser.add_argument("--startup_script", default=None,
                         help="Путь к стартовому скрипту (опционально).")
+    parser.add_argument("--vfs_cache_mb", type=int, default=64,
+                        help="Размер кэша содержимого файлов VFS в МБ (по умолчанию 64).")
+    parser.add_argument("--scrollback", type=int, default=10000,
+                        help="Максимальное число строк в окне вывода GUI (по умолчанию 10000).")
+    parser.add_argument("--headless", action="store_true",
+                        help="Выполнить стартовый скрипт (или команды из stdin) без GUI.")
+    parser.add_argument("--output_file", default=None,
+                        help="Файл для вывода в режиме --headless (по умолчанию stdout).")
+    parser.add_argument("--profile", default=None,
+                        help="Профилировать команды и записать сводку (время, счётчики) в JSON-файл.")
+    parser.add_argument("--profile_trace", default=None,
+                        help="Профилировать команды и записать трассу в формате Chrome trace (chrome://tracing).")
     return parser.parse_args()
@@ -1,27 +1,42 @@
-import tkinter as tk
-from tkinter import scrolledtext
-import os
-import socket
-import getpass
-import shlex
+import time
 
 from practice_1_var_14.config import parse_args
 from practice_1_var_14 import commands as cmdmod
+from practice_1_var_14.runner import ScriptRunner, run_headless, write_profile
 
+# Вывод копится и вставляется в виджет не чаще раза за кадр (~60 Гц)
+FLUSH_INTERVAL_MS = 16
+# Сколько времени за один тик event loop отдаётся стартовому скрипту
+SCRIPT_SLICE_SEC = 0.008
 
-class EmulatorGUI:
-    def __init__(self):
-        args = parse_args()
-        self.vfs_path = args.vfs_path
-        self.startup_script = args.startup_script
+# tkinter загружается только при создании окна: --headless и лаунчер
+# обходятся без него (и без libtk)
+tk = None
+scrolledtext = None
 
-        # user and host
-        try:
-            self.user = getpass.getuser()
-        except Exception:
-            self.user = os.environ.get("USER", "user")
-        self.hostname = socket.gethostname()
 
+class EmulatorGUI(ScriptRunner):
+    def __init__(self, args=None):
+        if args is None:
+            args = parse_args()
+        self.vfs_path = args.vfs_path
+        self.startup_script = args.startup_script
+        self.scrollback = max(1, args.scrollback)
+        self._pending = []
+        self._pending_lines = 0
+        self._flush_id = None
+        cmdmod.set_content_cache_limit(args.vfs_cache_mb * 1024 * 1024)
+
+        # user, host and VFS state
+        super().__init__()
+        self.args = args
+        if args.profile or args.profile_trace:
+            from practice_1_var_14.profiler import Profiler
+            self.profiler = Profiler(cmdmod.profile_counters)
+
+        global tk, scrolledtext
+        import tkinter as tk
+        from tkinter import scrolledtext
         self.root = tk.Tk()
         self.root.title(f"Эмулятор - [{self.user}@{self.hostname}]")
         self.root.geometry("900x600")
@@ -34,19 +49,13 @@ class EmulatorGUI:
         self.entry.bind("<Return>", self.on_enter)
         self.entry.focus()
 
-        # VFS state
-        self.vfs = {"type": "dir", "children": {}, "owner": "root"}
-        self.current_dir = "/"
-        self.prompt = f"{self.user}@{self.hostname}:{self.current_dir}$ "
+        source = f"vfs_image={args.vfs_image}" if args.vfs_image else f"vfs_path={self.vfs_path}"
+        self.print_output(f"Параметры запуска: {source}, startup_script={self.startup_script}")
 
-        self.print_output(f"Параметры запуска: vfs_path={self.vfs_path}, startup_script={self.startup_script}")
-
-        # load vfs (from disk into memory)
-        if os.path.exists(self.vfs_path) and os.path.isdir(self.vfs_path):
-            self.vfs = cmdmod.build_vfs_from_disk(self.vfs_path)
-            self.print_output(f"Загружен VFS из: {self.vfs_path}")
+        if args.vfs_image:
+            self.load_vfs_image(args.vfs_image)
         else:
-            self.print_output(f"VFS путь '{self.vfs_path}' не найден или не директория — загружен пустой VFS.")
+            self.load_vfs(self.vfs_path)
 
         self.print_output(self.prompt, end="")
 
@@ -54,103 +63,103 @@ class EmulatorGUI:
             self._run_startup_script(self.startup_script)
 
     def print_output(self, text, end="\n"):
-        self.output.config(state=tk.NORMAL)
         if text is None:
             text = ""
-        self.output.insert(tk.END, str(text) + end)
+        chunk = str(text) + end
+        self._pending.append(chunk)
+        self._pending_lines += chunk.count("\n")
+        if self._pending_lines > 2 * self.scrollback:
+            # при потоке вывода не копим то, что всё равно будет обрезано
+            self._pending = [self._tail_lines("".join(self._pending))]
+            self._pending_lines = self.scrollback
+        if self._flush_id is None:
+            self._flush_id = self.root.after(FLUSH_INTERVAL_MS, self._flush_output)
+
+    def _tail_lines(self, text):
+        lines = text.split("\n")
+        if len(lines) > self.scrollback + 1:
+            lines = lines[-(self.scrollback + 1):]
+        return "\n".join(lines)
+
+    def _flush_output(self):
+        self._flush_id = None
+        if not self._pending:
+            return
+        text = self._tail_lines("".join(self._pending))
+        self._pending = []
+        self._pending_lines = 0
+        self.output.config(state=tk.NORMAL)
+        self.output.insert(tk.END, text)
+        # кольцевой буфер: удаляем самые старые строки сверх scrollback
+        last_line = int(self.output.index("end-1c").split(".")[0])
+        if last_line > self.scrollback:
+            self.output.delete("1.0", f"{last_line - self.scrollback + 1}.0")
         self.output.see(tk.END)
         self.output.config(state=tk.DISABLED)
 
+    def clear_output(self):
+        self._pending = []
+        self._pending_lines = 0
+        self.output.config(state=tk.NORMAL)
+        self.output.delete(1.0, tk.END)
+        self.output.config(state=tk.DISABLED)
+
+    def quit(self):
+        try:
+            self.root.quit()
+        except Exception:
+            pass
+
     def on_enter(self, event):
         cmdline = self.entry.get()
         self.entry.delete(0, tk.END)
         if not cmdline.strip():
             self.print_output(self.prompt, end="")
             return
-        self.print_output(self.prompt + cmdline)
-        try:
-            parts = shlex.split(cmdline)
-        except Exception as e:
-            self.print_output(f"Ошибка разбора команды: {e}")
-            self.print_output(self.prompt, end="")
-            return
-        cmd = parts[0]
-        args = parts[1:]
-        result = cmdmod.execute_command(cmd, args, self)
-
-        if cmd == "clear":
-            self.output.config(state=tk.NORMAL)
-            self.output.delete(1.0, tk.END)
-            self.output.config(state=tk.DISABLED)
-
+        if self.run_line(cmdline):
             self.print_output(self.prompt, end="")
-            return
-
-        if result is None:
-            try:
-                self.root.quit()
-            except Exception:
-                pass
-            return
-
-        if result != "":
-            self.print_output(result)
-        else:
-
-            pass
-
-        self.prompt = f"{self.user}@{self.hostname}:{self.current_dir}$ "
-        self.print_output(self.prompt, end="")
 
     def _run_startup_script(self, path):
-        if not os.path.exists(path):
+        # скрипт выполняется порциями между событиями Tk, чтобы окно не зависало
+        try:
+            f = open(path, "r", encoding="utf-8")
+        except FileNotFoundError:
             self.print_output(f"Ошибка: Скрипт {path} не найден.")
             return
+        except Exception as e:
+            self.print_output(f"Ошибка выполнения стартового скрипта: {e}")
+            return
+        self._run_script_slice(f)
+
+    def _run_script_slice(self, f):
+        deadline = time.perf_counter() + SCRIPT_SLICE_SEC
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                for raw in f:
-                    line = raw.rstrip("\n")
-                    if not line.strip():
-                        self.print_output("")
-                        continue
-                    if line.strip().startswith("#"):
-                        self.print_output(line)
-                        continue
-
-                    self.print_output(self.prompt + line)
-                    try:
-                        parts = shlex.split(line)
-                    except Exception as e:
-                        self.print_output(f"Ошибка разбора строки: {e}")
-                        continue
-                    cmd = parts[0]
-                    args = parts[1:]
-                    result = cmdmod.execute_command(cmd, args, self)
-                    if cmd == "clear":
-                        self.output.config(state=tk.NORMAL)
-                        self.output.delete(1.0, tk.END)
-                        self.output.config(state=tk.DISABLED)
-                        continue
-                    if result is None:
-
-                        try:
-                            self.root.quit()
-                        except Exception:
-                            pass
-                        return
-                    if result != "":
-                        self.print_output(result)
-
-                    self.prompt = f"{self.user}@{self.hostname}:{self.current_dir}$ "
-
-                self.print_output(self.prompt, end="")
+            for raw in f:
+                if not self.run_line(raw):
+                    f.close()
+                    return
+                if time.perf_counter() > deadline:
+                    self.root.after(1, self._run_script_slice, f)
+                    return
+            self.print_output(self.prompt, end="")
         except Exception as e:
             self.print_output(f"Ошибка выполнения стартового скрипта: {e}")
+        f.close()
 
     def run(self):
         self.root.mainloop()
+        if self.profiler is not None:
+            write_profile(self.profiler, self.args)
 
 
-if __name__ == "__main__":
-    app = EmulatorGUI()
+def main():
+    args = parse_args()
+    if args.headless:
+        run_headless(args)
+        return
+    app = EmulatorGUI(args)
     app.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import os
+import io
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from practice_1_var_14 import commands as cmdmod
+from practice_1_var_14.runner import ScriptRunner
+
+
+# Этап: параллельный запуск многих сессий над одним VFS.
+# Потоки: один корень VFS на всех, copy-on-write даёт каждой сессии свою копию
+# только изменённых узлов. Процессы: каждый процесс один раз загружает VFS
+# в инициализаторе (образ через mmap делит страницы кэша ОС между процессами).
+
+_worker_vfs = None
+
+
+def load_vfs_root(vfs_path=None, vfs_image=None):
+    if vfs_image:
+        from practice_1_var_14.vfs_image import load_vfs_image
+        return load_vfs_image(vfs_image)
+    if vfs_path and os.path.isdir(vfs_path):
+        return cmdmod.build_vfs_from_disk(vfs_path)
+    return cmdmod.empty_vfs()
+
+
+def _init_worker(vfs_path, vfs_image, cache_bytes):
+    global _worker_vfs
+    cmdmod.set_content_cache_limit(cache_bytes)
+    _worker_vfs = load_vfs_root(vfs_path, vfs_image)
+
+
+def run_session(vfs_root, script_path, user=None, hostname=None):
+    # Одна сессия: свой вывод, своя текущая директория, свои изменения VFS.
+    # Ошибка в сессии не должна ронять остальные.
+    out = io.StringIO()
+    runner = ScriptRunner(out, vfs=vfs_root, user=user, hostname=hostname)
+    wall = time.perf_counter()
+    cpu = time.thread_time()
+    status = "ok"
+    error = ""
+    try:
+        with open(script_path, "r", encoding="utf-8") as f:
+            if not runner.run_lines(f):
+                status = "exit"
+    except Exception as e:
+        status = "error"
+        error = f"{type(e).__name__}: {e}"
+    return {
+        "script": script_path,
+        "status": status,
+        "error": error,
+        "wall_sec": time.perf_counter() - wall,
+        "cpu_sec": time.thread_time() - cpu,
+        "output": out.getvalue(),
+    }
+
+
+def _run_in_worker(script_path, user, hostname):
+    return run_session(_worker_vfs, script_path, user, hostname)
+
+
+def run_sessions(scripts, vfs_path=None, vfs_image=None, workers=None, processes=False,
+                 user=None, hostname=None, cache_bytes=64 * 1024 * 1024):
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    if processes:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(vfs_path, vfs_image, cache_bytes)) as pool:
+            results = list(pool.map(_run_in_worker, scripts,
+                                    [user] * len(scripts), [hostname] * len(scripts)))
+    else:
+        cmdmod.set_content_cache_limit(cache_bytes)
+        root = load_vfs_root(vfs_path, vfs_image)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(lambda p: run_session(root, p, user, hostname), scripts))
+    wall = time.perf_counter() - started
+    summary = {
+        "mode": "process" if processes else "thread",
+        "workers": workers,
+        "sessions": len(results),
+        "failed": sum(1 for r in results if r["status"] == "error"),
+        "wall_sec": wall,
+        "cpu_sec": sum(r["cpu_sec"] for r in results),
+        "session_wall_max": max((r["wall_sec"] for r in results), default=0.0),
+        "sessions_per_sec": len(results) / wall if wall > 0 else 0.0,
+    }
+    return results, summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Параллельный запуск сценариев эмулятора над одним VFS")
+    parser.add_argument("scripts", nargs="+", help="Файлы сценариев, по одной сессии на файл")
+    parser.add_argument("--vfs_path", type=str, default="", help="Путь к VFS на диске")
+    parser.add_argument("--vfs_image", type=str, default="", help="Путь к упакованному образу VFS")
+    parser.add_argument("--vfs_cache_mb", type=int, default=64, help="Предел кэша содержимого файлов, МБ")
+    parser.add_argument("--workers", type=int, default=0, help="Число потоков/процессов (по умолчанию - число CPU)")
+    parser.add_argument("--processes", action="store_true", help="Процессы вместо потоков")
+    parser.add_argument("--output_dir", type=str, default="", help="Куда сохранить вывод каждой сессии")
+    parser.add_argument("--report", type=str, default="", help="JSON-отчёт по сессиям")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.vfs_image:
+        # проверка образа до запуска: в процессах ошибка инициализатора
+        # превратилась бы в BrokenProcessPool без объяснения
+        try:
+            load_vfs_root(vfs_image=args.vfs_image)
+        except (OSError, ValueError) as e:
+            print(f"Не удалось загрузить образ VFS '{args.vfs_image}': {e}", file=sys.stderr)
+            return 1
+    results, summary = run_sessions(args.scripts, args.vfs_path, args.vfs_image,
+                                    args.workers, args.processes,
+                                    cache_bytes=args.vfs_cache_mb * 1024 * 1024)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+        for i, r in enumerate(results):
+            name = f"{i:04d}_{os.path.basename(r['script'])}.out"
+            with open(os.path.join(args.output_dir, name), "w", encoding="utf-8") as f:
+                f.write(r["output"])
+    for r in results:
+        line = f"{r['script']}: {r['status']}, {r['wall_sec'] * 1000:.1f} мс"
+        if r["error"]:
+            line += f" ({r['error']})"
+        print(line)
+    print(f"Сессий: {summary['sessions']}, ошибок: {summary['failed']}, "
+          f"время: {summary['wall_sec']:.3f} с, {summary['sessions_per_sec']:.1f} сессий/с")
+    if args.report:
+        report = dict(summary)
+        report["results"] = [{k: v for k, v in r.items() if k != "output"} for r in results]
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
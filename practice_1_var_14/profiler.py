@@ -0,0 +1,130 @@
+import os
+import json
+import time
+import threading
+
+
+# Профилирование (--profile): время (реальное и CPU) и счётчики по командам
+# и стадиям конвейера, выгрузка в JSON и в формат Chrome trace
+# (chrome://tracing, Perfetto). Без --profile профилировщик не создаётся,
+# и код команд проверяет только session.profiler is None.
+class Profiler:
+    def __init__(self, counters=None):
+        # counters() -> словарь текущих значений счётчиков; у каждого
+        # интервала записывается разница значений до и после
+        self.counters = counters or dict
+        self.started = time.perf_counter()
+        self.events = []
+        self.totals = {}
+        self._stack = []
+        self._lock = threading.Lock()
+        self._tids = {}
+
+    def span(self, name, cat="command", args=None):
+        return _Span(self, name, cat, args)
+
+    def stage(self, name, chunks):
+        return _timed_stage(self, name, chunks)
+
+    def call_stage(self, name, fn, *args):
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            return fn(*args)
+        finally:
+            self._add("stage", name, time.perf_counter() - wall, time.thread_time() - cpu)
+
+    def _add(self, cat, name, wall, cpu, counters=None):
+        with self._lock:
+            entry = self.totals.setdefault((cat, name), {"calls": 0, "wall_sec": 0.0, "cpu_sec": 0.0})
+            entry["calls"] += 1
+            entry["wall_sec"] += wall
+            entry["cpu_sec"] += cpu
+            for key, value in (counters or {}).items():
+                if value:
+                    entry[key] = entry.get(key, 0) + value
+
+    def _event(self, name, cat, start, wall, args):
+        tid = threading.get_ident()
+        with self._lock:
+            self.events.append({
+                "name": name, "cat": cat, "ph": "X",
+                "ts": round((start - self.started) * 1e6, 3),
+                "dur": round(wall * 1e6, 3),
+                "pid": os.getpid(),
+                "tid": self._tids.setdefault(tid, len(self._tids) + 1),
+                "args": args,
+            })
+
+    def summary(self):
+        groups = {}
+        for (cat, name), entry in sorted(self.totals.items(), key=lambda item: -item[1]["wall_sec"]):
+            groups.setdefault(cat, {})[name] = entry
+        return {"total_wall_sec": time.perf_counter() - self.started, **groups}
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+
+    def write_trace(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+
+
+class _Span:
+    __slots__ = ("profiler", "name", "cat", "args", "start", "cpu", "before")
+
+    def __init__(self, profiler, name, cat, args):
+        self.profiler = profiler
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.before = self.profiler.counters()
+        self.cpu = time.thread_time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self.start
+        cpu = time.thread_time() - self.cpu
+        after = self.profiler.counters()
+        counters = {k: v - self.before.get(k, 0) for k, v in after.items() if v != self.before.get(k, 0)}
+        self.profiler._add(self.cat, self.name, wall, cpu, counters)
+        args = dict(self.args or {})
+        args.update(counters)
+        args["cpu_ms"] = round(cpu * 1000, 3)
+        self.profiler._event(self.name, self.cat, self.start, wall, args)
+        return False
+
+
+def _timed_stage(profiler, name, chunks):
+    # Стадии конвейера - генераторы, выполняющиеся вперемешку: время каждого
+    # next() относится к стадии, а из времени вызывающей стадии вычитается
+    # (profiler._stack - стадии, которые сейчас ждут своих поставщиков)
+    stack = profiler._stack
+    own = [0.0, 0.0, 0]
+    it = iter(chunks)
+    try:
+        while True:
+            wall = time.perf_counter()
+            cpu = time.thread_time()
+            stack.append(own)
+            try:
+                chunk = next(it)
+            except StopIteration:
+                return
+            finally:
+                stack.pop()
+                wall = time.perf_counter() - wall
+                cpu = time.thread_time() - cpu
+                own[0] += wall
+                own[1] += cpu
+                if stack:
+                    stack[-1][0] -= wall
+                    stack[-1][1] -= cpu
+            own[2] += 1
+            yield chunk
+    finally:
+        profiler._add("stage", name, own[0], own[1], {"chunks": own[2]})
@@ -0,0 +1,167 @@
+import os
+import sys
+import time
+
+from practice_1_var_14 import commands as cmdmod
+from practice_1_var_14.session import Session
+
+
+class ScriptRunner(Session):
+    # Выполнение команд без GUI: сессия + вывод в поток (stdout/файл).
+    # EmulatorGUI наследуется от него и переопределяет только вывод.
+    def __init__(self, out=None, vfs=None, user=None, hostname=None):
+        super().__init__(vfs, user, hostname)
+        self.out = out if out is not None else sys.stdout
+
+    def print_output(self, text, end="\n"):
+        if text is None:
+            text = ""
+        self.out.write(str(text) + end)
+
+    def clear_output(self):
+        pass
+
+    def quit(self):
+        pass
+
+    def load_vfs(self, vfs_path):
+        # load vfs (from disk into memory)
+        if os.path.exists(vfs_path) and os.path.isdir(vfs_path):
+            self.vfs = cmdmod.build_vfs_from_disk(vfs_path)
+            self.print_output(f"Загружен VFS из: {vfs_path}")
+        else:
+            self.print_output(f"VFS путь '{vfs_path}' не найден или не директория — загружен пустой VFS.")
+
+    def load_vfs_image(self, image_path):
+        # импорт здесь: образ нужен не в каждом запуске
+        from practice_1_var_14.vfs_image import load_vfs_image
+        try:
+            self.vfs = load_vfs_image(image_path)
+            self.print_output(f"Загружен образ VFS: {image_path}")
+        except (OSError, ValueError) as e:
+            self.print_output(f"Не удалось загрузить образ VFS '{image_path}': {e} — загружен пустой VFS.")
+
+    def run_line(self, raw):
+        # False, если выполнена команда exit
+        line = raw.rstrip("\n")
+        if not line.strip():
+            self.print_output("")
+            return True
+        if line.strip().startswith("#"):
+            self.print_output(line)
+            return True
+
+        self.print_output(self.prompt + line)
+        try:
+            stages, redirect = cmdmod.parse_command_line(line)
+        except ValueError as e:
+            self.print_output(f"Ошибка разбора строки: {e}")
+            return True
+        timed = stages[0][0] == "time"
+        if timed:
+            # встроенная команда time: время всего конвейера
+            stages[0] = stages[0][1:]
+            if not stages[0]:
+                self.print_output("time: требуется команда")
+                return True
+            wall = time.perf_counter()
+            cpu = time.process_time()
+        if self.profiler is None:
+            result = self.run_pipeline(stages, redirect)
+        else:
+            with self.profiler.span(" | ".join(argv[0] for argv in stages), "command", {"line": line}):
+                result = self.run_pipeline(stages, redirect)
+        if timed:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            self.print_output(f"время: {wall * 1000:.3f} мс, CPU: {cpu * 1000:.3f} мс")
+        return result
+
+    def run_pipeline(self, stages, redirect):
+        stream = cmdmod.execute_pipeline(stages, redirect, self)
+        if stream is None:
+            self.quit()
+            return False
+        if len(stages) == 1 and stages[0][0] == "clear" and redirect is None:
+            self.clear_output()
+            return True
+        self.write_stream(stream)
+
+        self.update_prompt()
+        return True
+
+    def write_stream(self, chunks):
+        # вывод конвейера выводится по мере получения кусков
+        last = ""
+        for chunk in chunks:
+            if chunk:
+                self.print_output(chunk, end="")
+                last = chunk
+        if last and not last.endswith("\n"):
+            self.print_output("")
+
+    def run_lines(self, lines):
+        # False, если скрипт завершился командой exit
+        for raw in lines:
+            if not self.run_line(raw):
+                return False
+        self.print_output(self.prompt, end="")
+        return True
+
+    def run_isolated(self, lines):
+        # Выполнить сценарий и откатить все его изменения VFS
+        with self.transaction() as tx:
+            try:
+                return self.run_lines(lines)
+            finally:
+                tx.rollback()
+
+    def run_script(self, path):
+        if not os.path.exists(path):
+            self.print_output(f"Ошибка: Скрипт {path} не найден.")
+            return True
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return self.run_lines(f)
+        except Exception as e:
+            self.print_output(f"Ошибка выполнения стартового скрипта: {e}")
+            return True
+
+
+def write_profile(profiler, args):
+    if args.profile:
+        profiler.write_json(args.profile)
+    if args.profile_trace:
+        profiler.write_trace(args.profile_trace)
+
+
+def run_headless(args):
+    cmdmod.set_content_cache_limit(args.vfs_cache_mb * 1024 * 1024)
+    if args.output_file:
+        out = open(args.output_file, "w", encoding="utf-8", buffering=1024 * 1024)
+    else:
+        out = sys.stdout
+    try:
+        runner = ScriptRunner(out)
+        if args.profile or args.profile_trace:
+            from practice_1_var_14.profiler import Profiler
+            runner.profiler = Profiler(cmdmod.profile_counters)
+        source = f"vfs_image={args.vfs_image}" if args.vfs_image else f"vfs_path={args.vfs_path}"
+        runner.print_output(f"Параметры запуска: {source}, startup_script={args.startup_script}")
+        if args.vfs_image:
+            runner.load_vfs_image(args.vfs_image)
+        else:
+            runner.load_vfs(args.vfs_path)
+        if args.startup_script:
+            runner.run_script(args.startup_script)
+        else:
+            # без скрипта команды читаются из stdin
+            runner.run_lines(sys.stdin)
+        runner.print_output("")
+        if runner.profiler is not None:
+            write_profile(runner.profiler, args)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        else:
+            out.flush()
@@ -0,0 +1,70 @@
+import os
+import getpass
+
+from practice_1_var_14 import commands as cmdmod
+
+
+def current_user():
+    try:
+        return getpass.getuser()
+    except Exception:
+        return os.environ.get("USER", "user")
+
+
+def current_host():
+    try:
+        return os.uname().nodename
+    except AttributeError:
+        # Windows: os.uname нет, socket импортируется только здесь
+        import socket
+        return socket.gethostname()
+
+
+class Transaction:
+    # Транзакция над VFS и текущей директорией: откат - возврат к снимку
+    def __init__(self, session):
+        self.session = session
+        self.snap = session.snapshot()
+
+    def commit(self):
+        self.snap = self.session.snapshot()
+
+    def rollback(self):
+        self.session.restore(self.snap)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.rollback()
+        return False
+
+
+class Session:
+    # Состояние одной сессии оболочки, без GUI и без вывода: это объект,
+    # который получают команды из commands.py. Дерево VFS неизменяемо
+    # (copy-on-write), поэтому много сессий могут начинать с одного корня,
+    # и изменения каждой видны только ей.
+    def __init__(self, vfs=None, user=None, hostname=None):
+        self.user = user or current_user()
+        self.hostname = hostname or current_host()
+        self.vfs = vfs if vfs is not None else cmdmod.empty_vfs()
+        self.current_dir = "/"
+        # Profiler (profiler.py) при запуске с --profile
+        self.profiler = None
+        self.update_prompt()
+
+    def update_prompt(self):
+        self.prompt = f"{self.user}@{self.hostname}:{self.current_dir}$ "
+
+    def snapshot(self):
+        # O(1): дерево VFS не меняется на месте
+        return self.vfs, self.current_dir
+
+    def restore(self, snap):
+        self.vfs, self.current_dir = snap
+        self.update_prompt()
+
+    def transaction(self):
+        return Transaction(self)
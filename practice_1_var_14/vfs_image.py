@@ -0,0 +1,271 @@
+import io
+import os
+import sys
+import mmap
+import codecs
+import struct
+import argparse
+from collections import deque
+
+from practice_1_var_14.commands import VFSNode
+
+# Образ VFS: один файл, который эмулятор отображает в память (mmap).
+# Формат (little-endian):
+#   заголовок  IMAGE_HEADER
+#   таблица узлов  n_nodes записей NODE_RECORD; узлы в порядке обхода в
+#                  ширину, поэтому дети директории идут подряд
+#   таблица строк  n_strings + 1 смещений (uint32) и utf-8 blob имён/владельцев
+#   содержимое    файлы подряд, без разделителей
+# Запись узла: type (0 - dir, 1 - file), name, owner (номера строк), a, b:
+#   для директории a - номер первого ребёнка, b - число детей;
+#   для файла a - смещение в блоке содержимого, b - размер.
+IMAGE_MAGIC = b"VFSI"
+IMAGE_VERSION = 1
+IMAGE_HEADER = struct.Struct("<4sIIIQQQQ")
+NODE_RECORD = struct.Struct("<BIIQQ")
+TYPE_DIR = 0
+TYPE_FILE = 1
+
+
+def _scan_tree(base):
+    # Обход в ширину: [(имя, тип, путь на диске, индекс родителя)]
+    nodes = [("", TYPE_DIR, base, -1)]
+    children = {0: []}
+    queue = deque([0])
+    while queue:
+        i = queue.popleft()
+        path = nodes[i][2]
+        if path is None:
+            continue
+        try:
+            entries = sorted(os.scandir(path), key=lambda e: e.name)
+        except OSError:
+            entries = []
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            j = len(nodes)
+            children[i].append(j)
+            if is_dir:
+                # ссылку на директорию показываем, но не обходим (как os.walk)
+                nodes.append((entry.name, TYPE_DIR, None if entry.is_symlink() else entry.path, i))
+                children[j] = []
+                queue.append(j)
+            else:
+                nodes.append((entry.name, TYPE_FILE, entry.path, i))
+    return nodes, children
+
+
+def pack_directory(src_dir, image_path, owner="root"):
+    nodes, children = _scan_tree(os.path.abspath(src_dir))
+
+    strings = {}
+
+    def intern(s):
+        idx = strings.get(s)
+        if idx is None:
+            idx = strings[s] = len(strings)
+        return idx
+
+    owner_id = intern(owner)
+    sizes = {}
+    for i, (name, node_type, path, _) in enumerate(nodes):
+        intern(name)
+        if node_type == TYPE_FILE:
+            try:
+                sizes[i] = os.path.getsize(path)
+            except OSError:
+                sizes[i] = 0
+
+    records = []
+    content_offset = 0
+    for i, (name, node_type, path, _) in enumerate(nodes):
+        if node_type == TYPE_DIR:
+            kids = children.get(i, [])
+            records.append(NODE_RECORD.pack(TYPE_DIR, strings[name], owner_id, kids[0] if kids else 0, len(kids)))
+        else:
+            records.append(NODE_RECORD.pack(TYPE_FILE, strings[name], owner_id, content_offset, sizes[i]))
+            content_offset += sizes[i]
+
+    str_offsets = [0]
+    blob = bytearray()
+    for s in strings:
+        blob += s.encode("utf-8", "surrogateescape")
+        str_offsets.append(len(blob))
+    string_table = struct.pack(f"<{len(str_offsets)}I", *str_offsets) + bytes(blob)
+
+    strings_offset = IMAGE_HEADER.size + NODE_RECORD.size * len(nodes)
+    content_start = strings_offset + len(string_table)
+    tmp = image_path + f".tmp{os.getpid()}"
+    with open(tmp, "wb") as out:
+        out.write(IMAGE_HEADER.pack(IMAGE_MAGIC, IMAGE_VERSION, len(nodes), len(strings),
+                                    strings_offset, len(string_table), content_start, content_offset))
+        out.write(b"".join(records))
+        out.write(string_table)
+        # содержимое копируется потоково; размер фиксируется тем, что записано в таблицу
+        for i, (_, node_type, path, _) in enumerate(nodes):
+            if node_type != TYPE_FILE:
+                continue
+            left = sizes[i]
+            try:
+                with open(path, "rb") as f:
+                    while left > 0:
+                        chunk = f.read(min(left, 1024 * 1024))
+                        if not chunk:
+                            break
+                        out.write(chunk)
+                        left -= len(chunk)
+            except OSError:
+                pass
+            out.write(b"\0" * left)
+    os.replace(tmp, image_path)
+    return len(nodes), content_offset
+
+
+class ImageEntry:
+    # Источник узла VFS из образа (см. commands.dir_children / file_content)
+    __slots__ = ("image", "index")
+
+    def __init__(self, image, index):
+        self.image = image
+        self.index = index
+
+    def list_children(self):
+        return self.image.children(self.index)
+
+    def read(self):
+        return self.image.content(self.index)
+
+    def read_chunks(self, chunk_size):
+        return self.image.content_chunks(self.index, chunk_size)
+
+
+class VFSImage:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._check_layout(path)
+        except ValueError:
+            self.mm.close()
+            raise
+        self.view = memoryview(self.mm)
+        self._strings = {}
+
+    def _check_layout(self, path):
+        # Все таблицы должны помещаться в файл: иначе struct.error и чтение
+        # за концом mmap вместо понятной ошибки
+        size = len(self.mm)
+        if size < IMAGE_HEADER.size:
+            raise ValueError(f"{path}: не образ VFS")
+        (magic, version, self.n_nodes, n_strings, strings_offset, _,
+         self.content_offset, content_size) = IMAGE_HEADER.unpack_from(self.mm, 0)
+        self.n_strings = n_strings
+        self.content_size = content_size
+        if magic != IMAGE_MAGIC or version != IMAGE_VERSION:
+            raise ValueError(f"{path}: не образ VFS")
+        self.blob_offset = strings_offset + 4 * (n_strings + 1)
+        if (self.n_nodes < 1
+                or IMAGE_HEADER.size + NODE_RECORD.size * self.n_nodes > strings_offset
+                or self.blob_offset > size
+                or self.content_offset + content_size > size):
+            raise ValueError(f"{path}: образ обрезан")
+        self.str_offsets = struct.unpack_from(f"<{n_strings + 1}I", self.mm, strings_offset)
+        if self.blob_offset + self.str_offsets[-1] > self.content_offset:
+            raise ValueError(f"{path}: образ обрезан")
+        self._check_records(path)
+
+    def _check_records(self, path):
+        # Один проход по таблице узлов при загрузке: дальше children(),
+        # _string() и content_view() читают записи без проверок. Дети идут
+        # после родителя (обход в ширину), поэтому циклов в образе быть не может
+        table = self.mm[IMAGE_HEADER.size:IMAGE_HEADER.size + NODE_RECORD.size * self.n_nodes]
+        for i, (node_type, name, owner, a, b) in enumerate(NODE_RECORD.iter_unpack(table)):
+            if name >= self.n_strings or owner >= self.n_strings:
+                raise ValueError(f"{path}: узел {i}: неверный номер строки")
+            if node_type == TYPE_DIR:
+                if b and (a <= i or a + b > self.n_nodes):
+                    raise ValueError(f"{path}: узел {i}: неверный диапазон детей")
+            elif node_type == TYPE_FILE:
+                if a + b > self.content_size:
+                    raise ValueError(f"{path}: узел {i}: содержимое за границей образа")
+            else:
+                raise ValueError(f"{path}: узел {i}: неизвестный тип {node_type}")
+
+    def _string(self, sid):
+        s = self._strings.get(sid)
+        if s is None:
+            start = self.blob_offset + self.str_offsets[sid]
+            end = self.blob_offset + self.str_offsets[sid + 1]
+            s = self._strings[sid] = sys.intern(str(self.view[start:end], "utf-8", "surrogateescape"))
+        return s
+
+    def _record(self, index):
+        return NODE_RECORD.unpack_from(self.mm, IMAGE_HEADER.size + NODE_RECORD.size * index)
+
+    def node(self, index):
+        node_type, _, owner, _, _ = self._record(index)
+        kind = "dir" if node_type == TYPE_DIR else "file"
+        return VFSNode(kind, self._string(owner), source=ImageEntry(self, index))
+
+    def children(self, index):
+        _, _, _, first, count = self._record(index)
+        result = {}
+        for i in range(first, first + count):
+            result[self._string(self._record(i)[1])] = self.node(i)
+        return result
+
+    def content_view(self, index):
+        # Срез mmap без копирования
+        _, _, _, offset, size = self._record(index)
+        start = self.content_offset + offset
+        return self.view[start:start + size]
+
+    def content(self, index):
+        try:
+            text = str(self.content_view(index), "utf-8")
+        except UnicodeDecodeError:
+            return None
+        # как при чтении файла в текстовом режиме
+        return text.replace("\r\n", "\n") if "\r" in text else text
+
+    def content_chunks(self, index, chunk_size):
+        # Потоковое декодирование среза mmap, переводы строк - как в content()
+        view = self.content_view(index)
+        decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder("utf-8")(), translate=True)
+        try:
+            for start in range(0, len(view), chunk_size):
+                text = decoder.decode(view[start:start + chunk_size])
+                if text:
+                    yield text
+            text = decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            return
+        if text:
+            yield text
+
+    def root(self):
+        return self.node(0)
+
+
+def load_vfs_image(path):
+    return VFSImage(path).root()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Упаковка директории в образ VFS для --vfs_image.")
+    parser.add_argument("src_dir", help="Директория-источник")
+    parser.add_argument("image", help="Файл образа")
+    parser.add_argument("--owner", default="root", help="Владелец всех узлов (по умолчанию root)")
+    args = parser.parse_args()
+    if not os.path.isdir(args.src_dir):
+        print(f"Ошибка: {args.src_dir} не директория", file=sys.stderr)
+        sys.exit(1)
+    n_nodes, content_size = pack_directory(args.src_dir, args.image, args.owner)
+    print(f"Образ {args.image}: узлов {n_nodes}, содержимое {content_size} байт")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,62 +3,762 @@
 import argparse
 import sys
 import os
-import tarfile
-import urllib.request
+import io
+import time
+import re
+import math
+import csv
+import json
+import mmap
+import struct
+import hashlib
+import urllib.parse
+import threading
+import contextlib
+from array import array
 from collections import deque, defaultdict
+from collections.abc import Mapping
+from functools import lru_cache
 
 
 # Парсинг аргументов: этап 1
 def parse_args():
     parser = argparse.ArgumentParser(description="Dependency graph visualizer for Alpine APK packages")
-    parser.add_argument("--package", required=True, help="Имя анализируемого пакета")
-    parser.add_argument("--repo", required=True, help="URL-адрес репозитория или путь к тестовому файлу")
-    parser.add_argument("--mode", required=True, choices=["remote", "test"], help="remote = APK репозиторий, test = локальный файл")
-    parser.add_argument("--output", required=True, help="Имя файла для визуализации графа (PNG)")
-    parser.add_argument("--depth", required=True, type=int, help="Максимальная глубина обхода зависимостей")
+    parser.add_argument("--package", help="Имя анализируемого пакета")
+    parser.add_argument("--repo", nargs="+",
+                        help="URL-адреса репозиториев (http(s)://, file://, локальные пути) или путь к тестовому файлу; "
+                             "при совпадении имён пакетов приоритет у репозитория, указанного раньше. "
+                             "В режиме python - каталоги site-packages (по умолчанию sys.path)")
+    parser.add_argument("--mode", required=True, choices=["remote", "test", "python"],
+                        help="remote = APK репозиторий, test = локальный файл, python = установленные дистрибутивы Python")
+    parser.add_argument("--output", help="Имя файла для визуализации графа (PNG)")
+    parser.add_argument("--depth", type=int, help="Максимальная глубина обхода зависимостей")
+    parser.add_argument("--renderer", choices=["graphviz", "builtin"], default="graphviz",
+                        help="graphviz = dot (нужен Graphviz), builtin = послойная раскладка на matplotlib")
+    parser.add_argument("--max_nodes", type=int, default=None,
+                        help="Показать не больше N вершин (в порядке обхода в ширину от пакета)")
+    parser.add_argument("--cluster_scc", action="store_true", help="Группировать циклы (SCC) в кластеры в DOT")
+    parser.add_argument("--report", help="Пакетный анализ всего индекса: файл отчёта (.json или .csv)")
+    parser.add_argument("--diff", nargs="+", metavar="OLD_REPO",
+                        help="Сравнить старый индекс (OLD_REPO) с новым (--repo); с --report - отчёт в JSON")
+    parser.add_argument("--serve", metavar="[HOST:]PORT",
+                        help="Режим сервера запросов: держать индекс в памяти и отвечать по HTTP")
+    parser.add_argument("--resolve", nargs="+", metavar="PACKAGE",
+                        help="Подобрать согласованные версии для пакетов (foo, foo>=1.2); с --report - отчёт в JSON")
+    parser.add_argument("--cache_dir", default=default_cache_dir(), help="Каталог кэша разобранных индексов APKINDEX")
+    parser.add_argument("--no_cache", action="store_true", help="Не использовать кэш разобранных индексов")
+    parser.add_argument("--profile", help="Записать время и счётчики этапов в JSON-файл")
+    parser.add_argument("--profile_trace", help="Записать трассу этапов в формате Chrome trace (chrome://tracing)")
     args = parser.parse_args()
 
+    if not args.repo:
+        if args.mode != "python":
+            parser.error("для режимов remote и test обязателен аргумент --repo")
+        args.repo = python_site_dirs()
+    if args.mode == "python" and args.package:
+        args.package = normalize_dist_name(args.package)
+    if args.serve:
+        host, _, port = args.serve.rpartition(":")
+        if not port.isdigit() or not 0 < int(port) < 65536:
+            parser.error(f"--serve: ожидается [HOST:]PORT с портом 1-65535, получено {args.serve!r}")
+        args.serve_host, args.serve_port = host.strip("[]") or "127.0.0.1", int(port)
+    if args.report or args.serve or args.diff or args.resolve:
+        return args
+    missing = [opt for opt in ("package", "output", "depth") if getattr(args, opt) is None]
+    if missing:
+        parser.error("без --report/--serve/--diff/--resolve обязательны аргументы: " + ", ".join("--" + m for m in missing))
     if args.depth < 1:
         print("Ошибка: глубина должна быть >= 1", file=sys.stderr)
         sys.exit(1)
     return args
 
 
+# Профилирование (--profile, --profile_trace): время (реальное и CPU) и
+# счётчики этапов. Без этих флагов PROFILER = None, и этапы обходятся
+# пустым контекстом.
+class Profiler:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.counters = defaultdict(int)
+        self.totals = {}
+        self.events = []
+        self._lock = threading.Lock()
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    @contextlib.contextmanager
+    def span(self, name, args=None):
+        before = dict(self.counters)
+        cpu = time.thread_time()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - start
+            cpu = time.thread_time() - cpu
+            with self._lock:
+                delta = {k: v - before.get(k, 0) for k, v in self.counters.items() if v != before.get(k, 0)}
+                entry = self.totals.setdefault(name, {"calls": 0, "wall_sec": 0.0, "cpu_sec": 0.0})
+                entry["calls"] += 1
+                entry["wall_sec"] += wall
+                entry["cpu_sec"] += cpu
+                for k, v in delta.items():
+                    entry[k] = entry.get(k, 0) + v
+                self.events.append({
+                    "name": name, "cat": "stage", "ph": "X",
+                    "ts": round((start - self.started) * 1e6, 3), "dur": round(wall * 1e6, 3),
+                    "pid": os.getpid(), "tid": threading.get_ident(),
+                    "args": dict(args or {}, cpu_ms=round(cpu * 1000, 3), **delta),
+                })
+
+    def write(self, json_path=None, trace_path=None):
+        if json_path:
+            summary = {"total_wall_sec": time.perf_counter() - self.started,
+                       "counters": dict(self.counters),
+                       "stages": dict(sorted(self.totals.items(), key=lambda item: -item[1]["wall_sec"]))}
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump(summary, f, ensure_ascii=False, indent=2)
+        if trace_path:
+            with open(trace_path, "w", encoding="utf-8") as f:
+                json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+
+
+PROFILER = None
+NO_PROFILE = contextlib.nullcontext()
+
+
+def profile_stage(name, **args):
+    return PROFILER.span(name, args) if PROFILER is not None else NO_PROFILE
+
+
+def profile_count(name, n=1):
+    if PROFILER is not None:
+        PROFILER.count(name, n)
+
+
 # Сбор данных: этап 2
+def local_apkindex_path(url):
+    # Путь на диске для локального источника (путь, каталог, file://), иначе None
+    if not url.endswith(".tar.gz"):
+        url = url.rstrip("/") + "/APKINDEX.tar.gz"
+    parsed = urllib.parse.urlparse(url)
+    if parsed.scheme == "file":
+        from urllib.request import url2pathname
+        return url2pathname(parsed.path)
+    if parsed.scheme not in ("http", "https", "ftp"):
+        return url
+    return None
+
+
 def fetch_apkindex(url):
-    tmp_file = "APKINDEX.tar.gz"
+    # Локальный путь и file:// (зеркало) читаются с диска, остальное скачивается
+    # в память: общего временного файла нет, параллельные запуски не мешают друг другу
+    local = local_apkindex_path(url)
+    if local is not None:
+        # проверка здесь, а не при чтении: с кэшем архив сначала хэшируется
+        if not os.path.isfile(local):
+            print(f"Ошибка чтения APKINDEX: файл не найден: {local}", file=sys.stderr)
+            sys.exit(1)
+        return local
+    if not url.endswith(".tar.gz"):
+        url = url.rstrip("/") + "/APKINDEX.tar.gz"
+    # сетевые модули и asyncio импортируются там, где нужны: пакетные запуски
+    # (--mode test, кэш, --report) не должны платить за их загрузку
+    from urllib.request import urlopen
     try:
         print(f"Скачиваю APKINDEX из {url} ...")
-        urllib.request.urlretrieve(url, tmp_file)
+        with profile_stage("download", url=url), urlopen(url, timeout=60) as resp:
+            data = resp.read()
+        profile_count("bytes_downloaded", len(data))
+        return io.BytesIO(data)
     except Exception as e:
         print(f"Ошибка загрузки APKINDEX.tar.gz: {e}", file=sys.stderr)
         sys.exit(1)
 
+
+def read_apkindex(source):
+    # Потоковое чтение: архив распаковывается на лету, записи отдаются по одной.
+    # source - путь к архиву или файловый объект (BytesIO)
+    import tarfile
     try:
-        with tarfile.open(tmp_file, "r:gz") as tar:
-            member = tar.extractfile("APKINDEX")
-            if member is None:
-                raise Exception("APKINDEX not found inside archive")
-            return member.read().decode("utf-8").splitlines()
+        if isinstance(source, str):
+            profile_count("bytes_read", os.path.getsize(source))
+            tar = tarfile.open(source, "r:gz")
+        else:
+            source.seek(0)
+            profile_count("bytes_read", source.getbuffer().nbytes)
+            tar = tarfile.open(fileobj=source, mode="r:gz")
+        with tar:
+            for member in tar:
+                if member.name == "APKINDEX":
+                    stream = io.TextIOWrapper(tar.extractfile(member), encoding="utf-8")
+                    yield from iter_apkindex_records(stream)
+                    return
+        raise Exception("APKINDEX not found inside archive")
     except Exception as e:
         print(f"Ошибка чтения APKINDEX: {e}", file=sys.stderr)
         sys.exit(1)
 
 
+# Поля записи APKINDEX, которые нужны для анализа
+APK_FIELDS = {
+    "P": "name",
+    "V": "version",
+    "S": "size",
+    "I": "installed_size",
+    "D": "depends",
+    "p": "provides",
+    "k": "provider_priority",
+}
+
+
+def iter_apkindex_records(lines):
+    record = {}
+    for line in lines:
+        line = line.rstrip("\n")
+        if not line:
+            if record:
+                yield record
+                record = {}
+            continue
+        field = APK_FIELDS.get(line[:1])
+        if field is None or line[1:2] != ":":
+            continue
+        value = line[2:].strip()
+        if field in ("depends", "provides"):
+            record[field] = value.split()
+        elif field in ("size", "installed_size", "provider_priority"):
+            record[field] = int(value) if value.isdigit() else 0
+        else:
+            record[field] = value
+    if record:
+        yield record
+
+
+# Операторы версий в зависимостях и provides: foo>=1.2, foo~1.2, foo=1.0-r0, foo<2
+DEP_OPERATOR_RE = re.compile(r"[<>=~]")
+
+
+def split_dependency(token):
+    # "!foo>=1.2" -> ("foo", True); "so:libc.so.1=1" -> ("so:libc.so.1", False)
+    conflict = token.startswith("!")
+    name = DEP_OPERATOR_RE.split(token.lstrip("!"), 1)[0]
+    return name, conflict
+
+
+def build_provides_index(providers):
+    # providers: виртуальное имя -> [(provider_priority, пакет)]
+    # результат: виртуальное имя -> пакеты, начиная с самого приоритетного
+    return {
+        virtual: [pkg for _, pkg in sorted(candidates, key=lambda c: -c[0])]
+        for virtual, candidates in providers.items()
+    }
+
+
+def collect_apkindex(records):
+    # Один проход по записям: сырые зависимости пакетов, provides (p:) и версии
+    raw_deps = {}
+    providers = defaultdict(list)
+    versions = {}
+    for record in records:
+        name = record.get("name")
+        if not name:
+            continue
+        raw_deps.setdefault(name, []).extend(record.get("depends", []))
+        versions.setdefault(name, record.get("version"))
+        priority = record.get("provider_priority", 0)
+        for token in record.get("provides", []):
+            virtual, _ = split_dependency(token)
+            providers[virtual].append((priority, name))
+    return raw_deps, providers, versions
 
-def parse_apk_dependencies(index_lines):
+
+def merge_apkindexes(indexes):
+    # Правила приоритета для нескольких репозиториев (в порядке --repo):
+    # пакет берётся из первого репозитория, где он есть; поставщики
+    # виртуальных имён объединяются, при равном k: выигрывает более ранний
+    # репозиторий (сортировка в build_provides_index устойчивая).
+    raw_deps = {}
+    providers = defaultdict(list)
+    versions = {}
+    for repo_deps, repo_providers, repo_versions in indexes:
+        for name, tokens in repo_deps.items():
+            if name not in raw_deps:
+                raw_deps[name] = tokens
+                versions[name] = repo_versions.get(name)
+        for virtual, candidates in repo_providers.items():
+            providers[virtual].extend(candidates)
+    return raw_deps, providers, versions
+
+
+def resolve_dependencies(raw_deps, providers):
+    # so:/cmd:/pc: и прочие виртуальные имена разрешаются через
+    # хэш-индекс provides в реальные пакеты
+    provides = build_provides_index(providers)
     deps = defaultdict(list)
-    current_pkg = None
-    for line in index_lines:
-        if line.startswith("P:"):
-            current_pkg = line[2:].strip()
-        elif line.startswith("D:") and current_pkg:
-            raw = line[2:].strip().split()
-            cleaned = [d for d in raw if not d.startswith("so:") and not d.startswith("cmd:")]
-            deps[current_pkg].extend(cleaned)
+    for pkg, tokens in raw_deps.items():
+        resolved = deps[pkg]
+        for token in tokens:
+            dep, conflict = split_dependency(token)
+            if conflict:
+                continue
+            if dep not in raw_deps and dep in provides:
+                dep = provides[dep][0]
+            if dep != pkg and dep not in resolved:
+                resolved.append(dep)
     return deps
 
 
+def parse_apk_dependencies(records):
+    raw_deps, providers, _ = collect_apkindex(records)
+    return resolve_dependencies(raw_deps, providers)
+
+
+# Кэш разобранного индекса на диске.
+# Формат (все числа - uint32, порядок байт little-endian):
+#   заголовок: magic, version, n_strings, n_packages, n_edges, blob_size
+#   str_offsets[n_strings + 1], pkg_names[n_packages],
+#   edge_offsets[n_packages + 1], edges[n_edges], utf-8 blob строк
+CACHE_MAGIC = b"DVZC"
+CACHE_VERSION = 2
+CACHE_HEADER = struct.Struct("<4s5I")
+
+
+def default_cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "depviz")
+
+
+def archive_digest(source):
+    if not isinstance(source, str):
+        return hashlib.sha256(source.getbuffer()).hexdigest()
+    h = hashlib.sha256()
+    with open(source, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _u32_array(values):
+    arr = array("I", values)
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr
+
+
+def save_deps_cache(path, deps_map):
+    strings = {}
+
+    def intern(s):
+        idx = strings.get(s)
+        if idx is None:
+            idx = strings[s] = len(strings)
+        return idx
+
+    pkg_names = []
+    edge_offsets = [0]
+    edges = []
+    for pkg, deps in deps_map.items():
+        pkg_names.append(intern(pkg))
+        edges.extend(intern(d) for d in deps)
+        edge_offsets.append(len(edges))
+
+    str_offsets = [0]
+    blob = bytearray()
+    for s in strings:
+        blob += s.encode("utf-8")
+        str_offsets.append(len(blob))
+
+    tmp = path + f".tmp{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, len(strings), len(pkg_names), len(edges), len(blob)))
+        for values in (str_offsets, pkg_names, edge_offsets, edges):
+            _u32_array(values).tofile(f)
+        f.write(blob)
+    os.replace(tmp, path)
+
+
+class CachedDepsMap(Mapping):
+    # Карта зависимостей поверх mmap кэш-файла: списки зависимостей
+    # декодируются только при обращении к пакету
+    def __init__(self, buf):
+        magic, version, n_strings, n_packages, n_edges, blob_size = CACHE_HEADER.unpack_from(buf, 0)
+        if magic != CACHE_MAGIC or version != CACHE_VERSION:
+            raise ValueError("неверный формат кэша")
+        pos = CACHE_HEADER.size
+        view = memoryview(buf)
+
+        def take(count):
+            nonlocal pos
+            part = view[pos:pos + 4 * count]
+            pos += 4 * count
+            if sys.byteorder != "little":
+                return _u32_array(part.tobytes())
+            return part.cast("I")
+
+        self._str_offsets = take(n_strings + 1)
+        pkg_names = take(n_packages)
+        self._edge_offsets = take(n_packages + 1)
+        self._edges = take(n_edges)
+        self._blob = view[pos:pos + blob_size]
+        if len(self._blob) != blob_size:
+            raise ValueError("кэш обрезан")
+        self._index = {self._string(sid): i for i, sid in enumerate(pkg_names)}
+
+    def _string(self, sid):
+        return str(self._blob[self._str_offsets[sid]:self._str_offsets[sid + 1]], "utf-8")
+
+    def __getitem__(self, pkg):
+        i = self._index[pkg]
+        return [self._string(sid) for sid in self._edges[self._edge_offsets[i]:self._edge_offsets[i + 1]]]
+
+    def __contains__(self, pkg):
+        return pkg in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+
+def load_deps_cache(path):
+    try:
+        with open(path, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return CachedDepsMap(buf)
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def load_apk_dependencies(sources, cache_dir=None):
+    # Разбор одного или нескольких индексов с кэшем по sha256 архивов;
+    # cache_dir=None - без кэша. Архивы разбираются параллельно.
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=len(sources)) as pool:
+        cache_file = None
+        if cache_dir is not None:
+            with profile_stage("cache_lookup"):
+                digests = list(pool.map(archive_digest, sources))
+                key = digests[0] if len(digests) == 1 else hashlib.sha256("\n".join(digests).encode()).hexdigest()
+                cache_file = os.path.join(cache_dir, key + ".idx")
+                cached = load_deps_cache(cache_file)
+            if cached is not None:
+                profile_count("cache_hits")
+                print(f"Индекс загружен из кэша: {cache_file}")
+                return cached
+            profile_count("cache_misses")
+        indexes = list(pool.map(_parse_source, sources))
+    with profile_stage("resolve"):
+        raw_deps, providers, _ = merge_apkindexes(indexes)
+        deps_map = resolve_dependencies(raw_deps, providers)
+    if cache_file is not None:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            save_deps_cache(cache_file, deps_map)
+        except OSError as e:
+            print(f"Не удалось сохранить кэш индекса: {e}", file=sys.stderr)
+    return deps_map
+
+
+def _parse_source(source):
+    with profile_stage("parse", source=source if isinstance(source, str) else "<memory>"):
+        return collect_apkindex(read_apkindex(source))
+
+
+def load_repositories(repos, cache_dir=None):
+    from concurrent.futures import ThreadPoolExecutor
+    with profile_stage("fetch"), ThreadPoolExecutor(max_workers=len(repos)) as pool:
+        sources = list(pool.map(fetch_apkindex, repos))
+    return load_apk_dependencies(sources, cache_dir)
+
+
+def load_index_snapshot(repos):
+    # Зависимости и версии пакетов (без кэша: в кэше версий нет)
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=len(repos)) as pool:
+        with profile_stage("fetch"):
+            sources = list(pool.map(fetch_apkindex, repos))
+        indexes = list(pool.map(_parse_source, sources))
+    raw_deps, providers, versions = merge_apkindexes(indexes)
+    return resolve_dependencies(raw_deps, providers), versions
+
+
+# Окружение Python (--mode python): установленные дистрибутивы из
+# site-packages за один проход, без importlib.metadata для каждого пакета.
+# Читается только заголовок METADATA (до пустой строки). Имена нормализуются
+# по PEP 503, зависимость с extras ведёт в вершину "pkg[extra]", которая
+# зависит от "pkg" и от требований этого extra. Маркеры PEP 508 вычисляются
+# для текущего интерпретатора.
+DIST_NAME_RE = re.compile(r"[-_.]+")
+REQUIREMENT_RE = re.compile(r"^\s*([A-Za-z0-9][A-Za-z0-9._-]*)\s*(?:\[([^\]]*)\])?[^;]*(?:;\s*(.*))?$")
+MARKER_TOKEN_RE = re.compile(
+    r"""\s*(\(|\)|not\s+in\b|in\b|and\b|or\b|===|==|!=|<=|>=|~=|<|>|'[^']*'|"[^"]*"|[A-Za-z_][A-Za-z0-9_.]*)""")
+MARKER_VERSION_RE = re.compile(r"^\d+(?:\.\d+)*$")
+
+
+def normalize_dist_name(name):
+    return DIST_NAME_RE.sub("-", name).lower()
+
+
+def python_site_dirs():
+    # каталоги sys.path в порядке поиска импорта
+    dirs = []
+    for path in sys.path:
+        path = os.path.abspath(path or os.curdir)
+        if os.path.isdir(path) and path not in dirs:
+            dirs.append(path)
+    return dirs
+
+
+@lru_cache(maxsize=1)
+def marker_environment():
+    import platform
+    return {
+        "os_name": os.name,
+        "sys_platform": sys.platform,
+        "platform_machine": platform.machine(),
+        "platform_python_implementation": platform.python_implementation(),
+        "platform_release": platform.release(),
+        "platform_system": platform.system(),
+        "platform_version": platform.version(),
+        "python_version": ".".join(platform.python_version_tuple()[:2]),
+        "python_full_version": platform.python_version(),
+        "implementation_name": sys.implementation.name,
+        "implementation_version": platform.python_version(),
+    }
+
+
+def _marker_compare(left, op, right):
+    if op == "in":
+        return left in right
+    if op == "not in":
+        return left not in right
+    if op == "===":
+        return left == right
+    if MARKER_VERSION_RE.match(left) and MARKER_VERSION_RE.match(right.rstrip(".*")):
+        have = tuple(int(p) for p in left.split("."))
+        want = tuple(int(p) for p in right.rstrip(".*").split("."))
+        n = len(want)
+        # PEP 440: недостающие компоненты - нули ("3.11" == "3.11.0")
+        width = max(len(have), n)
+        have += (0,) * (width - len(have))
+        want += (0,) * (width - n)
+        if op == "~=":
+            return have >= want and have[:n - 1] == want[:n - 1]
+        if right.endswith(".*") and op in ("==", "!="):
+            return (have[:n] == want[:n]) == (op == "==")
+    else:
+        have, want = left, right
+    if op in ("==", "~="):
+        return have == want
+    if op == "!=":
+        return have != want
+    if op == "<":
+        return have < want
+    if op == ">":
+        return have > want
+    if op == "<=":
+        return have <= want
+    return have >= want
+
+
+def evaluate_marker(marker, env):
+    # PEP 508: сравнения переменных окружения со строками, and/or, скобки
+    tokens = [t.group(1) for t in MARKER_TOKEN_RE.finditer(marker)]
+    pos = 0
+
+    def value():
+        nonlocal pos
+        token = tokens[pos]
+        pos += 1
+        if token[:1] in "'\"":
+            return token[1:-1]
+        if token == "extra":
+            return env.get("extra", "")
+        return env.get(token, "")
+
+    def atom():
+        nonlocal pos
+        if tokens[pos] == "(":
+            pos += 1
+            result = expr()
+            pos += 1
+            return result
+        left = value()
+        op = " ".join(tokens[pos].split())
+        pos += 1
+        right = value()
+        if op in ("==", "!=") and (tokens[pos - 1] == "extra" or tokens[pos - 3] == "extra"):
+            left, right = normalize_dist_name(left), normalize_dist_name(right)
+        return _marker_compare(left, op, right)
+
+    def and_expr():
+        nonlocal pos
+        result = atom()
+        while pos < len(tokens) and tokens[pos] == "and":
+            pos += 1
+            result = atom() and result
+        return result
+
+    def expr():
+        nonlocal pos
+        result = and_expr()
+        while pos < len(tokens) and tokens[pos] == "or":
+            pos += 1
+            result = and_expr() or result
+        return result
+
+    try:
+        return expr()
+    except IndexError:
+        # неразборчивый маркер: зависимость лучше показать, чем потерять
+        return True
+
+
+def read_dist_metadata(path):
+    # -> (имя, версия, [Requires-Dist], [Provides-Extra]) из *.dist-info/METADATA
+    # или *.egg-info/PKG-INFO + requires.txt; None, если метаданных нет
+    egg = path.endswith(".egg-info")
+    meta_path = os.path.join(path, "PKG-INFO" if egg else "METADATA")
+    if egg and os.path.isfile(path):
+        meta_path = path
+    headers = defaultdict(list)
+    try:
+        with open(meta_path, "r", encoding="utf-8", errors="replace") as f:
+            key = None
+            for line in f:
+                if line in ("\n", "\r\n"):
+                    # строка только из пробелов - продолжение поля (например, License)
+                    break
+                if line[:1] in " \t" and key:
+                    headers[key][-1] += " " + line.strip()
+                    continue
+                key, _, value = line.partition(":")
+                headers[key].append(value.strip())
+    except OSError:
+        return None
+    if not headers.get("Name"):
+        return None
+    requires = headers.get("Requires-Dist", [])
+    extras = headers.get("Provides-Extra", [])
+    if egg and not requires:
+        requires, extras = read_egg_requires(os.path.join(path, "requires.txt"))
+    return headers["Name"][0], (headers.get("Version") or [None])[0], requires, extras
+
+
+def read_egg_requires(path):
+    # requires.txt: секции [extra], [extra:маркер], [:маркер] -> строки Requires-Dist
+    requires, extras = [], []
+    marker = ""
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                if line.startswith("["):
+                    extra, _, cond = line[1:-1].partition(":")
+                    parts = []
+                    if extra:
+                        extras.append(extra)
+                        parts.append(f'extra == "{extra}"')
+                    if cond:
+                        parts.append(f"({cond})")
+                    marker = " and ".join(parts)
+                    continue
+                requires.append(f"{line} ; {marker}" if marker else line)
+    except OSError:
+        pass
+    return requires, extras
+
+
+def scan_python_environment(dirs):
+    # -> (зависимости: имя -> [имена], версии: имя -> версия)
+    env = marker_environment()
+    deps = {}
+    versions = {}
+    for site_dir in dirs:
+        try:
+            entries = [e.path for e in os.scandir(site_dir) if e.name.endswith((".dist-info", ".egg-info"))]
+        except OSError:
+            continue
+        for path in sorted(entries):
+            meta = read_dist_metadata(path)
+            if meta is None:
+                continue
+            name, version, requires, extras = meta
+            name = normalize_dist_name(name)
+            if name in deps:
+                # как при импорте: выигрывает каталог, который раньше в sys.path
+                continue
+            versions[name] = version
+            extras = [normalize_dist_name(e) for e in extras]
+            base = deps[name] = []
+            extra_deps = {extra: [name] for extra in extras}
+            for requirement in requires:
+                match = REQUIREMENT_RE.match(requirement)
+                if match is None:
+                    continue
+                dep_name, dep_extras, marker = match.groups()
+                dep_name = normalize_dist_name(dep_name)
+                targets = [dep_name] + [f"{dep_name}[{normalize_dist_name(e.strip())}]"
+                                        for e in (dep_extras or "").split(",") if e.strip()]
+                if not marker or evaluate_marker(marker, env):
+                    lists = [base]
+                else:
+                    lists = [extra_deps[e] for e in extras if evaluate_marker(marker, dict(env, extra=e))]
+                for target in targets:
+                    for lst in lists:
+                        if target not in lst and target != name:
+                            lst.append(target)
+            for extra, children in extra_deps.items():
+                deps[f"{name}[{extra}]"] = children
+    # вершины вида pkg[extra], на которые ссылаются, но которых нет в метаданных
+    for children in list(deps.values()):
+        for child in children:
+            if child.endswith("]") and child not in deps:
+                deps[child] = [child.split("[", 1)[0]]
+    return deps, versions
+
+
+def load_python_environment(dirs, cache_dir=None):
+    # Кэш - тот же бинарный формат, что и для APKINDEX; ключ - mtime каталогов
+    # (установка и удаление дистрибутива меняют mtime site-packages) и
+    # интерпретатор, для которого вычислялись маркеры
+    cache_file = None
+    if cache_dir is not None:
+        stamp = []
+        for path in dirs:
+            try:
+                stamp.append(f"{path}:{os.stat(path).st_mtime_ns}")
+            except OSError:
+                stamp.append(f"{path}:-")
+        stamp.append(sys.version)
+        stamp.append(sys.platform)
+        key = hashlib.sha256("\n".join(stamp).encode()).hexdigest()
+        cache_file = os.path.join(cache_dir, "python-" + key + ".idx")
+        with profile_stage("cache_lookup"):
+            cached = load_deps_cache(cache_file)
+        if cached is not None:
+            profile_count("cache_hits")
+            print(f"Окружение загружено из кэша: {cache_file}")
+            return cached
+        profile_count("cache_misses")
+    with profile_stage("scan"):
+        deps_map, _ = scan_python_environment(dirs)
+    profile_count("distributions", len(deps_map))
+    if cache_file is not None:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            save_deps_cache(cache_file, deps_map)
+        except OSError as e:
+            print(f"Не удалось сохранить кэш окружения: {e}", file=sys.stderr)
+    return deps_map
+
+
 # Тестовые данные и BFS: этап 3
 def load_test_repository(path):
     if not os.path.exists(path):
@@ -88,43 +788,878 @@ def build_dependency_graph(root, deps_map, max_depth):
             if dep not in visited:
                 visited.add(dep)
                 queue.append((dep, depth + 1))
+    profile_count("nodes_visited", len(visited))
     return graph
 
 
 # Порядок загрузки: этап 4
+def plan_load_order(graph, start_package):
+    # graph уже ограничен build_dependency_graph, повторный обход не нужен.
+    # Циклы схлопываются в группы (SCC), порядок - сначала зависимости.
+    # Волна = группы, все зависимости которых установлены в предыдущих
+    # волнах; пакеты одной волны можно ставить параллельно.
+    deps_map = dict(graph)
+    deps_map.setdefault(start_package, [])
+    index = IndexGraph(deps_map)
+    level = [0] * len(index.components)
+    waves = []
+    for c, members in enumerate(index.components):
+        level[c] = 1 + max((level[d] for d in index.comp_adj[c]), default=-1)
+        if level[c] == len(waves):
+            waves.append([])
+        waves[level[c]].append(sorted(index.names[u] for u in members))
+    order = [name for wave in waves for group in wave for name in group]
+    cycles = [group for wave in waves for group in wave if len(group) > 1]
+    return {"order": order, "waves": waves, "critical_path": len(waves), "cycles": cycles}
+
+
 def get_load_order(graph, start_package):
-    visited = set()
-    subgraph = defaultdict(list)
-    queue = deque([start_package])
-    while queue:
-        node = queue.popleft()
-        if node in visited:
+    return plan_load_order(graph, start_package)["order"]
+
+
+# Разрешение версий: в отличие от графа (resolve_dependencies), где операторы
+# версий отбрасываются, здесь учитываются все версии каждого пакета из всех
+# репозиториев, ограничения (foo>=1.2, foo~1.2, so:libc.so.1=1) и конфликты
+# (!foo). Результат - согласованный набор пакетов для установки.
+APK_VERSION_RE = re.compile(r"^(\d+(?:\.\d+)*)([a-z]?)((?:_[a-z]+\d*)*)(?:~[0-9a-f]+)?(?:-r(\d+))?$")
+APK_SUFFIX_RE = re.compile(r"_([a-z]+)(\d*)")
+# суффиксы до релиза меньше версии без суффикса, после релиза - больше
+APK_SUFFIX_RANK = {"alpha": -4, "beta": -3, "pre": -2, "rc": -1, "cvs": 1, "svn": 2, "git": 3, "hg": 4, "p": 5}
+CONSTRAINT_RE = re.compile(r"^(!?)([^<>=~]+)(?:(<=|>=|=~|<|>|=|~)(.*))?$")
+
+
+@lru_cache(maxsize=None)
+def version_key(version):
+    # Ключ сравнения версий в духе apk: 1.2 < 1.10, 1.0_rc1 < 1.0 < 1.0_p1, -r0 < -r1
+    match = APK_VERSION_RE.match(version or "")
+    if match is None:
+        # нестандартная строка: сравниваются только числа по порядку
+        return tuple(int(d) for d in re.findall(r"\d+", version or "")), "", ((0, 0),), 0
+    numbers, letter, suffixes, revision = match.groups()
+    suffix_key = tuple((APK_SUFFIX_RANK.get(name, 0), int(num or 0))
+                       for name, num in APK_SUFFIX_RE.findall(suffixes)) + ((0, 0),)
+    return tuple(int(n) for n in numbers.split(".")), letter, suffix_key, int(revision or 0)
+
+
+def parse_constraint(token):
+    # "foo>=1.2" -> (("foo", ">=", "1.2"), False); "!foo" -> (("foo", None, None), True)
+    match = CONSTRAINT_RE.match(token)
+    if match is None:
+        return (token, None, None), False
+    conflict, name, op, version = match.groups()
+    if op == "=~":
+        op = "~"
+    return (name, op, version if op else None), bool(conflict)
+
+
+def version_satisfies(version, op, wanted):
+    if op is None:
+        return True
+    if version is None:
+        return False
+    if op == "~":
+        return version == wanted or (version.startswith(wanted) and not version[len(wanted)].isdigit())
+    have, want = version_key(version), version_key(wanted)
+    if op == "=":
+        return have == want
+    if op == "<":
+        return have < want
+    if op == ">":
+        return have > want
+    if op == "<=":
+        return have <= want
+    return have >= want
+
+
+class Candidate:
+    # Одна версия пакета из одного репозитория
+    __slots__ = ("name", "version", "depends", "conflicts", "provides", "priority", "repo")
+
+    def __init__(self, record, repo):
+        self.name = record["name"]
+        self.version = record.get("version")
+        self.priority = record.get("provider_priority", 0)
+        self.repo = repo
+        self.depends = []
+        self.conflicts = []
+        for token in record.get("depends", []):
+            constraint, conflict = parse_constraint(token)
+            (self.conflicts if conflict else self.depends).append(constraint)
+        self.provides = []
+        for token in record.get("provides", []):
+            (name, _, version), _ = parse_constraint(token)
+            self.provides.append((name, version))
+
+    def __repr__(self):
+        return f"{self.name}-{self.version}"
+
+
+class ResolveError(Exception):
+    pass
+
+
+class VersionResolver:
+    # Набор для установки по одному или многим корням. Для каждого ограничения
+    # (имя, оператор, версия) запоминается список подходящих кандидатов и
+    # замыкание - набор пакетов, который получается из него отдельно
+    # (лучшая подходящая версия и замыкания её зависимостей). Корни и общие
+    # зависимости многих корней поэтому разрешаются один раз. Если замыкания
+    # не сливаются (разные версии одного пакета, конфликт, цикл), для этого
+    # ограничения выполняется поиск с возвратом.
+    MAX_STEPS = 200000
+
+    def __init__(self, candidates):
+        # лучшие кандидаты - первыми: новее версия, при равной - раньше репозиторий
+        self.packages = defaultdict(list)
+        self.providers = defaultdict(list)
+        # имя -> кандидаты, объявившие конфликт с ним (!имя)
+        self.conflicted_by = defaultdict(list)
+        for cand in candidates:
+            self.packages[cand.name].append(cand)
+            for name, op, wanted in cand.conflicts:
+                self.conflicted_by[name].append((cand, op, wanted))
+            for virtual, version in cand.provides:
+                self.providers[virtual].append((cand, version))
+        for cands in self.packages.values():
+            cands.sort(key=lambda c: c.repo)
+            cands.sort(key=lambda c: version_key(c.version), reverse=True)
+        for provs in self.providers.values():
+            provs.sort(key=lambda p: p[0].repo)
+            provs.sort(key=lambda p: (p[0].priority, version_key(p[0].version)), reverse=True)
+        self._matches = {}
+        self._closures = {}
+        self._in_progress = set()
+        self.memo_hits = 0
+        self.memo_misses = 0
+
+    def matches(self, constraint):
+        result = self._matches.get(constraint)
+        if result is None:
+            name, op, wanted = constraint
+            if name in self.packages:
+                result = [c for c in self.packages[name] if version_satisfies(c.version, op, wanted)]
+            else:
+                result = [c for c, version in self.providers.get(name, ()) if version_satisfies(version, op, wanted)]
+            self._matches[constraint] = result
+        return result
+
+    def _conflicts(self, cand, chosen):
+        # нарушает ли cand конфликты уже выбранных пакетов или они - его
+        for name, op, wanted in cand.conflicts:
+            other = chosen.get(name)
+            if other is not None and other is not cand and version_satisfies(other.version, op, wanted):
+                return True
+        for other, op, wanted in self.conflicted_by.get(cand.name, ()):
+            if chosen.get(other.name) is other and other is not cand and version_satisfies(cand.version, op, wanted):
+                return True
+        return False
+
+    def _merge(self, chosen, closure):
+        # None, если замыкание не согласуется с выбранными пакетами
+        merged = dict(chosen)
+        for name, cand in closure.items():
+            prev = merged.get(name)
+            if prev is None:
+                if self._conflicts(cand, merged):
+                    return None
+                merged[name] = cand
+            elif prev is not cand:
+                return None
+        return merged
+
+    def closure(self, constraint):
+        result = self._closures.get(constraint)
+        if result is not None:
+            self.memo_hits += 1
+            if isinstance(result, ResolveError):
+                raise result
+            return result
+        self.memo_misses += 1
+        self._in_progress.add(constraint)
+        try:
+            result = self._closure(constraint)
+        except ResolveError as e:
+            self._closures[constraint] = e
+            raise
+        finally:
+            self._in_progress.discard(constraint)
+        self._closures[constraint] = result
+        return result
+
+    def _closure(self, constraint):
+        cands = self.matches(constraint)
+        if not cands:
+            raise ResolveError(f"нет пакета, удовлетворяющего {format_constraint(constraint)}")
+        for cand in cands:
+            chosen = {cand.name: cand}
+            for dep in cand.depends:
+                if any(c is chosen.get(c.name) for c in self.matches(dep)):
+                    continue
+                if dep in self._in_progress:
+                    return self.search([constraint])
+                try:
+                    sub = self.closure(dep)
+                except ResolveError:
+                    chosen = None
+                    break
+                chosen = self._merge(chosen, sub)
+                if chosen is None:
+                    return self.search([constraint])
+            if chosen is not None:
+                return chosen
+        # у лучших версий зависимости неразрешимы - полный перебор
+        return self.search([constraint])
+
+    def search(self, constraints):
+        # Поиск с возвратом: состояние - выбранные пакеты, очередь ограничений,
+        # позиция в ней и позиция, для которой не брать готовое замыкание
+        stack = [({}, list(constraints), 0, -1)]
+        steps = 0
+        while stack:
+            chosen, pending, i, no_memo = stack.pop()
+            while i < len(pending):
+                steps += 1
+                if steps > self.MAX_STEPS:
+                    raise ResolveError("слишком много вариантов, разрешение прервано")
+                constraint = pending[i]
+                i += 1
+                cands = self.matches(constraint)
+                if any(c is chosen.get(c.name) for c in cands):
+                    continue
+                memo = self._closures.get(constraint) if i - 1 != no_memo else None
+                if isinstance(memo, dict):
+                    merged = self._merge(chosen, memo)
+                    if merged is not None:
+                        # запасная ветвь - то же ограничение без готового замыкания
+                        stack.append((chosen, list(pending), i - 1, i - 1))
+                        chosen = merged
+                        continue
+                viable = [c for c in cands if c.name not in chosen and not self._conflicts(c, chosen)]
+                if not viable:
+                    chosen = None
+                    break
+                for alt in reversed(viable[1:]):
+                    branch = dict(chosen)
+                    branch[alt.name] = alt
+                    stack.append((branch, pending + alt.depends, i, -1))
+                cand = viable[0]
+                if len(viable) > 1:
+                    # chosen и pending теперь свои у каждой ветви
+                    chosen = dict(chosen)
+                    pending = pending + cand.depends
+                else:
+                    pending.extend(cand.depends)
+                chosen[cand.name] = cand
+            if chosen is not None:
+                return chosen
+        raise ResolveError("нет согласованного набора для " + ", ".join(map(format_constraint, constraints)))
+
+    def resolve(self, roots):
+        # roots - строки вида "foo", "foo>=1.2"; результат: имя -> Candidate
+        constraints = [parse_constraint(root)[0] for root in roots]
+        chosen = {}
+        for constraint in constraints:
+            chosen = self._merge(chosen, self.closure(constraint))
+            if chosen is None:
+                return self.search(constraints)
+        return chosen
+
+
+def format_constraint(constraint):
+    name, op, wanted = constraint
+    return name + (op + wanted if op else "")
+
+
+def load_candidates(args):
+    # Кандидаты из всех репозиториев --repo (номер репозитория - приоритет при равных версиях)
+    candidates = []
+    if args.mode == "remote":
+        from concurrent.futures import ThreadPoolExecutor
+        with profile_stage("fetch"), ThreadPoolExecutor(max_workers=len(args.repo)) as pool:
+            sources = list(pool.map(fetch_apkindex, args.repo))
+        with profile_stage("parse"):
+            for repo, source in enumerate(sources):
+                candidates.extend(Candidate(r, repo) for r in read_apkindex(source) if r.get("name"))
+    elif args.mode == "python":
+        deps_map, versions = scan_python_environment(args.repo)
+        for pkg, children in deps_map.items():
+            candidates.append(Candidate({"name": pkg, "version": versions.get(pkg), "depends": children}, 0))
+    else:
+        for repo, path in enumerate(args.repo):
+            for pkg, children in load_test_repository(path).items():
+                candidates.append(Candidate({"name": pkg, "depends": children}, repo))
+    return candidates
+
+
+def run_resolve(args):
+    with profile_stage("load"):
+        resolver = VersionResolver(load_candidates(args))
+    with profile_stage("resolve_versions", roots=" ".join(args.resolve)):
+        try:
+            chosen = resolver.resolve(args.resolve)
+        except ResolveError as e:
+            print(f"Ошибка разрешения: {e}", file=sys.stderr)
+            sys.exit(1)
+    packages = sorted(chosen.values(), key=lambda c: c.name)
+    print(f"\nНабор для установки ({len(packages)} пакетов):")
+    for cand in packages:
+        print(f"{cand.name} {cand.version or ''}".rstrip())
+    print(f"Замыкания: вычислено {resolver.memo_misses}, повторно использовано {resolver.memo_hits}")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"roots": args.resolve,
+                       "packages": [{"name": c.name, "version": c.version, "repo": args.repo[c.repo]} for c in packages]},
+                      f, ensure_ascii=False, indent=1)
+        print(f"Отчёт сохранён: {args.report}")
+
+
+# Пакетный анализ всего индекса: граф по целочисленным id, SCC (Тарьян),
+# граф конденсации, обратные зависимости и размеры транзитивных замыканий
+class IndexGraph:
+    def __init__(self, deps_map):
+        self.names = []
+        self.ids = {}
+        for pkg in deps_map:
+            self._id(pkg)
+        self.adj = [[] for _ in self.names]
+        for pkg, deps in deps_map.items():
+            self.adj[self.ids[pkg]] = [self._id(d) for d in deps]
+        # зависимости, отсутствующие в индексе, - узлы без исходящих рёбер
+        self.adj.extend([] for _ in range(len(self.names) - len(self.adj)))
+
+        self.rdeps = [[] for _ in self.names]
+        for u, deps in enumerate(self.adj):
+            for v in deps:
+                self.rdeps[v].append(u)
+
+        self.comp, self.components = tarjan_scc(self.adj)
+        self.comp_adj = condensation(self.adj, self.comp, len(self.components))
+
+    def _id(self, name):
+        i = self.ids.get(name)
+        if i is None:
+            i = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return i
+
+    def closure_sizes(self):
+        # Компоненты Тарьяна идут в обратном топологическом порядке
+        # (зависимости раньше зависящих), поэтому множество достижимых
+        # вершин компоненты собирается из уже посчитанных. Множества - битовые
+        # маски в int; маска освобождается, когда её прочитали все предки.
+        # Номер бита - позиция вершины в этом порядке, так что маски
+        # глубоких зависимостей остаются короткими.
+        n_comps = len(self.components)
+        pending = [0] * n_comps
+        for succ in self.comp_adj:
+            for d in succ:
+                pending[d] += 1
+        reach = [0] * n_comps
+        sizes = [0] * len(self.names)
+        bit = 0
+        for c, members in enumerate(self.components):
+            mask = ((1 << len(members)) - 1) << bit
+            bit += len(members)
+            for d in self.comp_adj[c]:
+                mask |= reach[d]
+                pending[d] -= 1
+                if pending[d] == 0:
+                    reach[d] = 0
+            total = bin(mask).count("1")
+            for u in members:
+                sizes[u] = total - 1
+            if pending[c]:
+                reach[c] = mask
+        return sizes
+
+    def report(self):
+        sizes = self.closure_sizes()
+        packages = []
+        for u, name in enumerate(self.names):
+            packages.append({
+                "name": name,
+                "scc": self.comp[u],
+                "scc_size": len(self.components[self.comp[u]]),
+                "deps": len(self.adj[u]),
+                "rdeps": len(self.rdeps[u]),
+                "closure_size": sizes[u],
+            })
+        cycles = [sorted(self.names[u] for u in members) for members in self.components if len(members) > 1]
+        return {
+            "packages": packages,
+            "cycles": cycles,
+            "stats": {
+                "packages": len(self.names),
+                "edges": sum(len(d) for d in self.adj),
+                "sccs": len(self.components),
+                "cyclic_sccs": len(cycles),
+                "condensation_edges": sum(len(d) for d in self.comp_adj),
+            },
+        }
+
+
+def tarjan_scc(adj):
+    # Итеративный алгоритм Тарьяна: O(V + E), без рекурсии
+    n = len(adj)
+    index = [-1] * n
+    low = [0] * n
+    on_stack = [False] * n
+    comp = [-1] * n
+    components = []
+    stack = []
+    counter = 0
+    for start in range(n):
+        if index[start] != -1:
             continue
-        visited.add(node)
-        for dep in graph.get(node, []):
-            subgraph[node].append(dep)
-            queue.append(dep)
-    # Топологическая сортировка Kahn
-    in_degree = {u: 0 for u in visited}
-    for u in subgraph:
-        for v in subgraph[u]:
-            in_degree[v] += 1
-    topo_queue = deque([u for u in visited if in_degree[u] == 0])
-    load_order = []
-    while topo_queue:
-        node = topo_queue.popleft()
-        load_order.append(node)
-        for neighbor in subgraph.get(node, []):
-            in_degree[neighbor] -= 1
-            if in_degree[neighbor] == 0:
-                topo_queue.append(neighbor)
-    if len(load_order) != len(visited):
-        print("Внимание! Граф содержит циклы. Порядок загрузки может быть неполным.")
-    return load_order
+        work = [(start, 0)]
+        while work:
+            u, i = work.pop()
+            if i == 0:
+                index[u] = low[u] = counter
+                counter += 1
+                stack.append(u)
+                on_stack[u] = True
+            recurse = False
+            deps = adj[u]
+            while i < len(deps):
+                v = deps[i]
+                i += 1
+                if index[v] == -1:
+                    work.append((u, i))
+                    work.append((v, 0))
+                    recurse = True
+                    break
+                if on_stack[v]:
+                    low[u] = min(low[u], index[v])
+            if recurse:
+                continue
+            if low[u] == index[u]:
+                members = []
+                while True:
+                    v = stack.pop()
+                    on_stack[v] = False
+                    comp[v] = len(components)
+                    members.append(v)
+                    if v == u:
+                        break
+                components.append(members)
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[u])
+    return comp, components
+
+
+def condensation(adj, comp, n_comps):
+    comp_adj = [set() for _ in range(n_comps)]
+    for u, deps in enumerate(adj):
+        cu = comp[u]
+        for v in deps:
+            if comp[v] != cu:
+                comp_adj[cu].add(comp[v])
+    return [sorted(d) for d in comp_adj]
+
+
+REPORT_COLUMNS = ["name", "scc", "scc_size", "deps", "rdeps", "closure_size"]
+
+
+def write_report(report, path):
+    if path.endswith(".csv"):
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=REPORT_COLUMNS)
+            writer.writeheader()
+            writer.writerows(report["packages"])
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+
+
+# Сравнение двух снимков индекса: изменённые записи и пакеты,
+# транзитивные замыкания которых нужно пересчитать
+def diff_indexes(old_deps, old_versions, new_deps, new_versions):
+    old_names, new_names = set(old_deps), set(new_deps)
+    added = sorted(new_names - old_names)
+    removed = sorted(old_names - new_names)
+    bumped = []
+    deps_changed = []
+    for name in sorted(old_names & new_names):
+        if old_versions.get(name) != new_versions.get(name):
+            bumped.append({"name": name, "old": old_versions.get(name), "new": new_versions.get(name)})
+        old_set, new_set = set(old_deps[name]), set(new_deps[name])
+        if old_set != new_set:
+            deps_changed.append({"name": name, "added": sorted(new_set - old_set), "removed": sorted(old_set - new_set)})
+    return {"added": added, "removed": removed, "version_bumped": bumped, "deps_changed": deps_changed}
+
+
+def affected_closures(diff, new_deps):
+    # Множество зависимостей пакета меняется, только если в его замыкании
+    # есть пакет с изменённым набором рёбер (добавлен, удалён, изменены D:).
+    # Это ровно обратное замыкание таких пакетов в новом графе.
+    graph = IndexGraph(new_deps)
+    seeds = set(diff["added"]) | set(diff["removed"]) | {d["name"] for d in diff["deps_changed"]}
+    queue = deque(graph.ids[name] for name in seeds if name in graph.ids)
+    affected = set(queue)
+    while queue:
+        u = queue.popleft()
+        for v in graph.rdeps[u]:
+            if v not in affected:
+                affected.add(v)
+                queue.append(v)
+
+    # Пересчёт только для затронутых: подграф, достижимый из них
+    reach = set(affected)
+    queue = deque(affected)
+    while queue:
+        u = queue.popleft()
+        for v in graph.adj[u]:
+            if v not in reach:
+                reach.add(v)
+                queue.append(v)
+    sub = IndexGraph({graph.names[u]: [graph.names[v] for v in graph.adj[u]] for u in reach})
+    sizes = sub.closure_sizes()
+    return {graph.names[u]: sizes[sub.ids[graph.names[u]]] for u in sorted(affected, key=graph.names.__getitem__)
+            if graph.names[u] in new_deps}
+
+
+def load_snapshot(args, repos):
+    if args.mode == "remote":
+        return load_index_snapshot(repos)
+    if args.mode == "python":
+        return scan_python_environment(repos)
+    deps_map = defaultdict(list)
+    for path in repos:
+        for pkg, children in load_test_repository(path).items():
+            deps_map.setdefault(pkg, children)
+    return deps_map, {}
+
+
+def run_diff(args):
+    old_deps, old_versions = load_snapshot(args, args.diff)
+    new_deps, new_versions = load_snapshot(args, args.repo)
+    with profile_stage("diff"):
+        diff = diff_indexes(old_deps, old_versions, new_deps, new_versions)
+    with profile_stage("affected_closures"):
+        diff["affected"] = affected_closures(diff, new_deps)
+    diff["stats"] = {
+        "old_packages": len(old_deps),
+        "new_packages": len(new_deps),
+        "added": len(diff["added"]),
+        "removed": len(diff["removed"]),
+        "version_bumped": len(diff["version_bumped"]),
+        "deps_changed": len(diff["deps_changed"]),
+        "affected": len(diff["affected"]),
+    }
+    stats = diff["stats"]
+    print(f"\nДобавлено: {stats['added']}, удалено: {stats['removed']}, "
+          f"новых версий: {stats['version_bumped']}, изменены зависимости: {stats['deps_changed']}")
+    print(f"Пересчитаны замыкания: {stats['affected']} из {stats['new_packages']} пакетов")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(diff, f, ensure_ascii=False, indent=1)
+        print(f"Отчёт сохранён: {args.report}")
+    else:
+        for name, size in diff["affected"].items():
+            print(f"{name}: {size}")
+
+
+# Режим сервера запросов: индекс загружается один раз и держится в памяти,
+# запросы обслуживаются по HTTP (asyncio), результаты мемоизируются
+class QueryIndex:
+    def __init__(self, deps_map):
+        self.graph = IndexGraph(deps_map)
+        self.closure = lru_cache(maxsize=4096)(self._closure)
+        self.path = lru_cache(maxsize=4096)(self._path)
+
+    def _closure(self, package, depth, reverse):
+        # Обход в ширину по id до глубины depth (None - без ограничения)
+        g = self.graph
+        adj = g.rdeps if reverse else g.adj
+        start = g.ids[package]
+        level = {start: 0}
+        queue = deque([start])
+        edges = defaultdict(list)
+        while queue:
+            u = queue.popleft()
+            if depth is not None and level[u] >= depth:
+                continue
+            for v in adj[u]:
+                if reverse:
+                    edges[g.names[v]].append(g.names[u])
+                else:
+                    edges[g.names[u]].append(g.names[v])
+                if v not in level:
+                    level[v] = level[u] + 1
+                    queue.append(v)
+        packages = [g.names[u] for u in level if u != start]
+        return {"package": package, "depth": depth, "packages": packages, "graph": dict(edges)}
+
+    def _path(self, source, target):
+        g = self.graph
+        start, goal = g.ids[source], g.ids[target]
+        parent = {start: None}
+        queue = deque([start])
+        while queue:
+            u = queue.popleft()
+            if u == goal:
+                path = []
+                while u is not None:
+                    path.append(g.names[u])
+                    u = parent[u]
+                return path[::-1]
+            for v in g.adj[u]:
+                if v not in parent:
+                    parent[v] = u
+                    queue.append(v)
+        return None
+
+    def query(self, kind, params):
+        def package(key="package"):
+            name = params.get(key)
+            if name not in self.graph.ids:
+                raise LookupError(f"пакет не найден: {name}")
+            return name
+
+        depth = int(params["depth"]) if "depth" in params else None
+        if depth is not None and depth < 0:
+            raise ValueError("глубина должна быть >= 0")
+        if kind == "deps":
+            return self.closure(package(), depth, False)
+        if kind == "rdeps":
+            return self.closure(package(), depth, True)
+        if kind == "load-order":
+            name = package()
+            return plan_load_order(self.closure(name, depth, False)["graph"], name)
+        if kind == "path":
+            return {"path": self.path(package("from"), package("to"))}
+        raise LookupError(f"неизвестный запрос: {kind}")
+
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                500: "Internal Server Error"}
+
+
+class DepvizServer:
+    def __init__(self, loader, watch_paths, check_interval=2.0):
+        self.loader = loader
+        self.watch_paths = watch_paths
+        self.check_interval = check_interval
+        self.index = QueryIndex(loader())
+        self._stamp = self._watch_stamp()
+        self._failed_stamp = None
+
+    def _watch_stamp(self):
+        stamp = []
+        for path in self.watch_paths:
+            try:
+                st = os.stat(path)
+                stamp.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                stamp.append(None)
+        return stamp
+
+    async def _watch(self):
+        import asyncio
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.check_interval)
+            stamp = self._watch_stamp()
+            if stamp == self._stamp or stamp == self._failed_stamp:
+                continue
+            print("Индекс изменился, перезагружаю ...")
+            # Загрузчик при битом (или недописанном) архиве вызывает sys.exit;
+            # сервер при этом продолжает отвечать по старому индексу, а _stamp
+            # не меняется - следующее изменение файлов снова запустит перезагрузку
+            try:
+                deps_map = await loop.run_in_executor(None, self.loader)
+                index = QueryIndex(deps_map)
+            except (Exception, SystemExit) as e:
+                self._failed_stamp = stamp
+                print(f"Ошибка перезагрузки индекса ({type(e).__name__}: {e}), "
+                      f"используется прежний: {len(self.index.graph.names)} пакетов")
+                continue
+            self.index = index
+            self._stamp = stamp
+            self._failed_stamp = None
+            print(f"Индекс перезагружен: {len(self.index.graph.names)} пакетов")
+
+    def dispatch(self, method, target):
+        if method != "GET":
+            return 405, {"error": "поддерживается только GET"}
+        url = urllib.parse.urlsplit(target)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        try:
+            # параметры запроса - от клиента: одним словарём, не как kwargs
+            with profile_stage("query:" + url.path.strip("/"), params=dict(params)):
+                return 200, self.index.query(url.path.strip("/"), params)
+        except LookupError as e:
+            return 404, {"error": str(e)}
+        except ValueError as e:
+            return 400, {"error": str(e)}
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode("latin-1")
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.split()
+            if len(parts) < 2:
+                status, body = 400, {"error": "неверный запрос"}
+            else:
+                try:
+                    status, body = self.dispatch(parts[0], parts[1])
+                except Exception as e:
+                    print(f"Ошибка обработки запроса {request_line.strip()}: {type(e).__name__}: {e}")
+                    status, body = 500, {"error": "внутренняя ошибка сервера"}
+            payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            head = (f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+                    "Content-Type: application/json; charset=utf-8\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    "Connection: close\r\n\r\n")
+            writer.write(head.encode("latin-1") + payload)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        import asyncio
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"Сервер запросов: http://{host}:{port}/ (deps, rdeps, load-order, path)")
+        watcher = asyncio.ensure_future(self._watch()) if self.watch_paths else None
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+
+
+def run_server(args):
+    import asyncio
+    if args.mode == "remote":
+        watch = [p for p in map(local_apkindex_path, args.repo) if p is not None]
+    else:
+        watch = list(args.repo)
+    server = DepvizServer(lambda: load_deps_map(args), watch)
+    try:
+        asyncio.run(server.serve(args.serve_host, args.serve_port))
+    except KeyboardInterrupt:
+        pass
 
 
 # Визуализация: этап 5
-def visualize_graph(graph, output_file="graph.png"):
+def limit_graph(graph, root, max_nodes):
+    # Оставляет первые max_nodes вершин в порядке обхода в ширину от root
+    keep = {root}
+    queue = deque([root])
+    while queue and len(keep) < max_nodes:
+        pkg = queue.popleft()
+        for dep in graph.get(pkg, []):
+            if dep not in keep and len(keep) < max_nodes:
+                keep.add(dep)
+                queue.append(dep)
+    limited = defaultdict(list)
+    for pkg, deps in graph.items():
+        if pkg in keep:
+            kept = [d for d in deps if d in keep]
+            if kept:
+                limited[pkg] = kept
+    return limited, keep
+
+
+def _dot_id(name):
+    return '"' + name.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def write_dot(graph, f, cluster_scc=False):
+    # Потоковая запись DOT: каждое ребро пишется сразу в файл
+    f.write("digraph dependencies {\n")
+    if cluster_scc:
+        index = IndexGraph(graph)
+        for i, members in enumerate(m for m in index.components if len(m) > 1):
+            f.write(f"    subgraph cluster_scc{i} {{\n        label=\"SCC {i}\";\n")
+            for u in members:
+                f.write(f"        {_dot_id(index.names[u])};\n")
+            f.write("    }\n")
+    for pkg, deps in graph.items():
+        for dep in deps:
+            f.write(f"    {_dot_id(pkg)} -> {_dot_id(dep)};\n")
+    f.write("}")
+
+
+def layered_layout(graph):
+    # Упрощённая раскладка Сугиямы: слой вершины = номер волны из
+    # plan_load_order (SCC в одном слое, зависимости ниже), затем несколько
+    # проходов барицентрического упорядочивания внутри слоёв.
+    # Фиктивные вершины для длинных рёбер не вводятся.
+    index = IndexGraph(graph)
+    level = [0] * len(index.components)
+    for c in range(len(index.components)):
+        level[c] = 1 + max((level[d] for d in index.comp_adj[c]), default=-1)
+    layers = [[] for _ in range(max(level, default=-1) + 1)]
+    for u in range(len(index.names)):
+        layers[level[index.comp[u]]].append(u)
+
+    pos = {}
+    for layer in layers:
+        for i, u in enumerate(layer):
+            pos[u] = i
+    neighbours = [index.adj[u] + index.rdeps[u] for u in range(len(index.names))]
+    for sweep in range(4):
+        ordered = layers if sweep % 2 == 0 else layers[::-1]
+        for layer in ordered:
+            def barycenter(u):
+                near = neighbours[u]
+                return sum(pos[v] for v in near) / len(near) if near else pos[u]
+            layer.sort(key=barycenter)
+            for i, u in enumerate(layer):
+                pos[u] = i
+
+    width = max((len(layer) for layer in layers), default=1)
+    coords = {}
+    for y, layer in enumerate(layers):
+        shift = (width - len(layer)) / 2
+        for i, u in enumerate(layer):
+            coords[index.names[u]] = (i + shift, y)
+    return coords, width, len(layers)
+
+
+def render_builtin(graph, png_file):
+    # Рисование без graphviz и внешних бинарников, только matplotlib
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    coords, width, height = layered_layout(graph)
+    fig, ax = plt.subplots(figsize=(min(4 + width * 1.2, 200), min(3 + height * 1.2, 200)))
+    # все рёбра - один artist quiver, стрелка останавливается перед вершиной
+    xs, ys, us, vs = [], [], [], []
+    for pkg, deps in graph.items():
+        x1, y1 = coords[pkg]
+        for dep in deps:
+            x2, y2 = coords[dep]
+            dx, dy = x2 - x1, y2 - y1
+            length = math.hypot(dx, dy) or 1.0
+            k = max(length - 0.15, 0.0) / length
+            xs.append(x1)
+            ys.append(y1)
+            us.append(dx * k)
+            vs.append(dy * k)
+    if xs:
+        ax.quiver(xs, ys, us, vs, angles="xy", scale_units="xy", scale=1, color="#888888",
+                  width=0.0015, headwidth=5, headlength=6, zorder=1)
+    for name, (x, y) in coords.items():
+        ax.text(x, y, name, ha="center", va="center", fontsize=8, zorder=2,
+                bbox={"boxstyle": "round", "fc": "white", "ec": "#333333"})
+    ax.set_xlim(-1, width)
+    ax.set_ylim(-1, height)
+    ax.axis("off")
+    fig.savefig(png_file, dpi=100, bbox_inches="tight")
+    plt.close(fig)
+
+
+def visualize_graph(graph, output_file="graph.png", root=None, max_nodes=None,
+                    cluster_scc=False, renderer="graphviz"):
     graphs_dir = "graphs"
     if not os.path.exists(graphs_dir):
         os.makedirs(graphs_dir)
@@ -132,56 +1667,120 @@ def visualize_graph(graph, output_file="graph.png"):
     dot_file = os.path.join(graphs_dir, output_file.replace(".png", ".dot"))
     png_base = os.path.join(graphs_dir, output_file.replace(".png", ""))
 
-    dot_content = "digraph dependencies {\n"
-    for pkg, deps in graph.items():
-        for dep in deps:
-            dot_content += f'    "{pkg}" -> "{dep}";\n'
-    dot_content += "}"
+    if max_nodes is not None and root is not None:
+        graph, shown = limit_graph(graph, root, max_nodes)
+        print(f"Показано вершин: {len(shown)} (ограничение --max_nodes {max_nodes})")
 
     with open(dot_file, "w", encoding="utf-8") as f:
-        f.write(dot_content)
+        write_dot(graph, f, cluster_scc)
+
+    if renderer == "builtin":
+        try:
+            render_builtin(graph, png_base + ".png")
+            print(f"Граф успешно сохранён в {png_base}.png")
+        except ImportError:
+            print("Установите matplotlib: pip install matplotlib")
+            print(f"DOT файл сохранён: {dot_file}")
+        return
 
     try:
         import graphviz
-        g = graphviz.Source(dot_content)
-        g.render(png_base, format="png", cleanup=True)
+        # dot читает файл сам: DOT большого графа не загружается в память целиком
+        graphviz.render("dot", "png", dot_file, outfile=png_base + ".png")
         print(f"Граф успешно сохранён в {png_base}.png")
     except ImportError:
         print("Установите graphviz: pip install graphviz")
         print(f"DOT файл сохранён: {dot_file}")
 
 
+def load_deps_map(args):
+    if args.mode == "remote":
+        return load_repositories(args.repo, None if args.no_cache else args.cache_dir)
+    if args.mode == "python":
+        return load_python_environment(args.repo, None if args.no_cache else args.cache_dir)
+    deps_map = defaultdict(list)
+    for path in args.repo:
+        for pkg, children in load_test_repository(path).items():
+            deps_map.setdefault(pkg, children)
+    return deps_map
+
+
+def run_report(args, deps_map):
+    with profile_stage("index_graph"):
+        graph = IndexGraph(deps_map)
+    with profile_stage("closures"):
+        report = graph.report()
+    with profile_stage("write_report"):
+        write_report(report, args.report)
+    stats = report["stats"]
+    print(f"\nПакетов: {stats['packages']}, рёбер: {stats['edges']}, "
+          f"SCC: {stats['sccs']}, циклических SCC: {stats['cyclic_sccs']}")
+    print(f"Отчёт сохранён: {args.report}")
+
+
 def main():
+    global PROFILER
     args = parse_args()
+    if args.profile or args.profile_trace:
+        PROFILER = Profiler()
+    try:
+        run(args)
+    finally:
+        if PROFILER is not None:
+            PROFILER.write(args.profile, args.profile_trace)
+
 
+def run(args):
     print("Параметры:")
     print(f"package={args.package}")
-    print(f"repo={args.repo}")
+    print(f"repo={' '.join(args.repo)}")
     print(f"mode={args.mode}")
     print(f"output={args.output}")
     print(f"depth={args.depth}")
 
-    if args.mode == "remote":
-        index_lines = fetch_apkindex(args.repo)
-        deps_map = parse_apk_dependencies(index_lines)
-    else:
-        deps_map = load_test_repository(args.repo)
+    if args.serve:
+        run_server(args)
+        return
+    if args.diff:
+        run_diff(args)
+        return
+    if args.resolve:
+        run_resolve(args)
+        return
+
+    with profile_stage("load"):
+        deps_map = load_deps_map(args)
+
+    if args.report:
+        run_report(args, deps_map)
+        return
 
     if args.package not in deps_map:
         print("Пакет не найден в репозитории", file=sys.stderr)
         sys.exit(1)
 
     print("\nПрямые зависимости:", deps_map[args.package])
-    graph = build_dependency_graph(args.package, deps_map, args.depth)
+    with profile_stage("bfs"):
+        graph = build_dependency_graph(args.package, deps_map, args.depth)
     print("\nПолный граф (до глубины):")
     for k, v in graph.items():
         print(k, "->", v)
 
     print("\nПорядок загрузки зависимостей:")
-    load_order = get_load_order(graph, args.package)
-    print(load_order)
+    with profile_stage("load_order"):
+        plan = plan_load_order(graph, args.package)
+    print(plan["order"])
+    print("\nВолны установки (пакеты одной волны можно ставить параллельно):")
+    for i, wave in enumerate(plan["waves"], 1):
+        print(f"{i}:", ", ".join("{" + " ".join(group) + "}" if len(group) > 1 else group[0] for group in wave))
+    print(f"Длина критического пути: {plan['critical_path']}")
+    for group in plan["cycles"]:
+        # группа - множество пакетов SCC (по алфавиту), а не путь по рёбрам
+        print("Цикл (устанавливается одной группой): {" + " ".join(group) + "}")
 
-    visualize_graph(graph, args.output)
+    with profile_stage("render"):
+        visualize_graph(graph, args.output, root=args.package, max_nodes=args.max_nodes,
+                        cluster_scc=args.cluster_scc, renderer=args.renderer)
 
 
 if __name__ == "__main__":
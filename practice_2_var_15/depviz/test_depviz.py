@@ -0,0 +1,109 @@
+# Тесты разбора метаданных Python-пакетов (--mode python).
+# Запуск: python -m pytest practice_2_var_15/depviz
+# или из каталога depviz: python -m unittest test_depviz
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import depviz  # noqa: E402
+
+
+ENV_311 = {"python_version": "3.11", "python_full_version": "3.11.0",
+           "sys_platform": "linux", "os_name": "posix"}
+ENV_390 = {"python_version": "3.9", "python_full_version": "3.9.0",
+           "sys_platform": "linux", "os_name": "posix"}
+
+
+class EvaluateMarkerTest(unittest.TestCase):
+    def check(self, marker, env, expected):
+        self.assertIs(bool(depviz.evaluate_marker(marker, env)), expected, marker)
+
+    def test_versions_padded_with_zeros(self):
+        self.check('python_version >= "3.11.0"', ENV_311, True)
+        self.check('python_version < "3.11.0"', ENV_311, False)
+        self.check('python_version == "3.11.0"', ENV_311, True)
+        self.check('python_full_version <= "3.9"', ENV_390, True)
+        self.check('python_full_version > "3.9"', ENV_390, False)
+        self.check('python_version < "3.10"', ENV_390, True)
+
+    def test_prefix_and_compatible_release(self):
+        self.check('python_full_version == "3.11.*"', ENV_311, True)
+        self.check('python_full_version != "3.11.*"', ENV_311, False)
+        self.check('python_version == "3.1.*"', ENV_311, False)
+        self.check('python_full_version ~= "3.9"', ENV_311, True)
+        self.check('python_full_version ~= "3.9.0"', ENV_311, False)
+        self.check('python_full_version ~= "3.9.0"', ENV_390, True)
+
+    def test_strings_and_logic(self):
+        self.check('sys_platform == "win32"', ENV_311, False)
+        self.check('sys_platform == "win32" or os_name == "posix"', ENV_311, True)
+        self.check('(sys_platform == "linux" and python_version < "3.10")', ENV_311, False)
+        self.check('"linux" in sys_platform', ENV_311, True)
+        self.check('extra == "socks"', dict(ENV_311, extra=""), False)
+        self.check('extra == "Socks_Proxy"', dict(ENV_311, extra="socks-proxy"), True)
+
+
+class ReadMetadataTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, relpath, text):
+        path = os.path.join(self.tmp.name, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return os.path.dirname(path)
+
+    def test_dist_info(self):
+        # строка из одних пробелов внутри License - продолжение поля, а не конец заголовков
+        path = self.write("demo-1.0.dist-info/METADATA", (
+            "Metadata-Version: 2.1\n"
+            "Name: Demo_Pkg\n"
+            "Version: 1.0\n"
+            "License: line one\n"
+            "        \n"
+            "        line two\n"
+            "Requires-Dist: numpy>=1.20\n"
+            "Requires-Dist: pysocks ; extra == 'socks'\n"
+            "Provides-Extra: socks\n"
+            "\n"
+            "Requires-Dist: not-a-header\n"
+        ))
+        name, version, requires, extras = depviz.read_dist_metadata(path)
+        self.assertEqual((name, version), ("Demo_Pkg", "1.0"))
+        self.assertEqual(requires, ["numpy>=1.20", "pysocks ; extra == 'socks'"])
+        self.assertEqual(extras, ["socks"])
+
+    def test_missing_metadata(self):
+        self.assertIsNone(depviz.read_dist_metadata(os.path.join(self.tmp.name, "none.dist-info")))
+
+    def test_egg_info_requires(self):
+        self.write("legacy.egg-info/PKG-INFO", "Name: legacy\nVersion: 0.3\n\n")
+        path = self.write("legacy.egg-info/requires.txt", (
+            "six\n"
+            "\n"
+            "[:python_version < \"3.8\"]\n"
+            "importlib-metadata\n"
+            "\n"
+            "[test]\n"
+            "pytest\n"
+            "[docs:sys_platform == \"win32\"]\n"
+            "sphinx\n"
+        ))
+        name, version, requires, extras = depviz.read_dist_metadata(path)
+        self.assertEqual((name, version), ("legacy", "0.3"))
+        self.assertEqual(requires, [
+            "six",
+            'importlib-metadata ; (python_version < "3.8")',
+            'pytest ; extra == "test"',
+            'sphinx ; extra == "docs" and (sys_platform == "win32")',
+        ])
+        self.assertEqual(extras, ["test", "docs"])
+
+
+if __name__ == "__main__":
+    unittest.main()